@@ -0,0 +1,58 @@
+import os
+import math
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+import crud
+import job_queue
+import tasks
+
+# Load environment variables
+load_dotenv()
+ADMISSION_MAX_BACKLOG = int(os.getenv("ADMISSION_MAX_BACKLOG", "100"))  # Analyses running or waiting for a worker
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "3"))  # Unfinished analyses per user
+# Analyses the workers run at once in total (processes x concurrency across all worker hosts)
+ANALYSIS_WORKER_CAPACITY = int(os.getenv(
+    "ANALYSIS_WORKER_CAPACITY",
+    int(os.getenv("WORKER_PROCESSES", "1")) * int(os.getenv("WORKER_CONCURRENCY", "4"))
+))
+# Assumed analysis duration (seconds) until there is completed work to measure
+DEFAULT_ANALYSIS_DURATION = float(os.getenv("DEFAULT_ANALYSIS_DURATION", "60"))
+
+class AdmissionRejected(Exception):
+    """Raised when a new analysis cannot be accepted right now."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+        super().__init__(detail)
+
+def check_admission(db: Session, user_id: str):
+    """Admit a new analysis or raise AdmissionRejected.
+
+    A user with ADMISSION_MAX_PER_USER unfinished analyses gets a 429; when the
+    in-flight plus queued analyses reach ADMISSION_MAX_BACKLOG everyone gets a
+    503. Retry-After is estimated from how long recent analyses took and how
+    many the workers run at once.
+    """
+    queue = job_queue.get_queue()
+    average_duration = queue.recent_duration(tasks.ANALYSIS_QUEUE) or DEFAULT_ANALYSIS_DURATION
+
+    if crud.count_active_tasks(db, user_id) >= ADMISSION_MAX_PER_USER:
+        raise AdmissionRejected(
+            429,
+            f"You already have {ADMISSION_MAX_PER_USER} analyses in progress. Please wait for one to finish.",
+            max(1, math.ceil(average_duration))
+        )
+
+    counts = queue.counts(tasks.ANALYSIS_QUEUE)
+    backlog = counts["queued"] + counts["running"]
+    if backlog >= ADMISSION_MAX_BACKLOG:
+        # Time for the workers to drain enough of the backlog to make room for one more
+        excess = backlog - ADMISSION_MAX_BACKLOG + 1
+        retry_after = excess * average_duration / max(1, ANALYSIS_WORKER_CAPACITY)
+        raise AdmissionRejected(
+            503,
+            "The analysis service is at capacity. Please try again later.",
+            max(1, math.ceil(retry_after))
+        )
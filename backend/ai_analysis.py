@@ -1,36 +1,154 @@
 import os
 import json
-import openai
-from typing import Dict, List, Any, Optional
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+import time
+import hashlib
+from typing import Dict, List, Any, Optional, AsyncIterator, Type, Callable
 from dotenv import load_dotenv
-import tiktoken
-from fastapi_cache.decorator import cache
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError, parse_obj_as
+import schemas
+import llm_client
+import llm_cache
+import llm_cassette
+import llm_metrics
+import token_budget
+import model_router
+import structured_output
+from singleflight import SingleFlight
+from pipeline import Stage, StageCallback, run_pipeline
+from circuit_breaker import CircuitOpenError
+import deadlines
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")
-MAX_TOKENS = 4000  # Default max tokens for response
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")  # Default model, also used to count tokens (see model_router.py)
+# Maximum number of stages of one analysis run at once. Set to 1 to run them one after another.
+MAX_PARALLEL_STAGES = int(os.getenv("ANALYSIS_MAX_PARALLEL_STAGES", "4"))
+STAGE_TIMEOUT = float(os.getenv("ANALYSIS_STAGE_TIMEOUT", "300"))  # Seconds per attempt of an LLM stage
+STAGE_RETRIES = int(os.getenv("ANALYSIS_STAGE_RETRIES", "1"))  # Extra attempts for a failed LLM stage
+ANALYSIS_DEADLINE = float(os.getenv("ANALYSIS_DEADLINE", "900"))  # Seconds for a whole analysis run
+# Produce key findings, model recommendation, implementation plan and recommendations
+# in a single completion instead of four
+COMBINED_SYNTHESIS = os.getenv("ANALYSIS_COMBINED_SYNTHESIS", "false").lower() == "true"
+# Ask for JSON mode (response_format=json_object) on stages that return JSON
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
 
 # Token counting
 def count_tokens(text: str) -> int:
     """Count the number of tokens in a text string."""
-    encoding = tiktoken.encoding_for_model(MODEL)
-    return len(encoding.encode(text))
-
-# Retry decorator for OpenAI API calls
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
-def call_openai_api(messages, max_tokens=MAX_TOKENS, temperature=0.7):
-    """Call OpenAI API with retry logic."""
-    response = openai.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-        max_tokens=max_tokens,
-        temperature=temperature,
+    return token_budget.count_tokens(text, MODEL)
+
+# Identical requests that are already in flight share one upstream call / pipeline run
+_completion_flights = SingleFlight()
+_submission_flights = SingleFlight()
+
+def is_json(text: str) -> bool:
+    """Whether a response parses as JSON."""
+    try:
+        json.loads(text)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+# OpenAI API calls go through the model router, the completion cache and the
+# shared async client (pooled connections + retries)
+async def call_openai_api(messages, max_tokens=None, temperature=0.7, expect_json=False, use_cache=True, stage=None,
+                          validate: Optional[Callable[[str], Any]] = None):
+    """Call OpenAI API with retry logic.
+
+    The model is picked by the model router from ``stage`` and the prompt's
+    token count. Unless ``max_tokens`` is given, the completion is sized from
+    the budget of ``stage``.
+
+    Identical requests are answered from the LLM cache, or join an identical
+    request that is already in flight, unless ``use_cache`` is False. With
+    ``expect_json``, JSON mode is requested, and responses that are not JSON
+    even after repair are returned but not cached, as are responses for which
+    ``validate`` raises ValueError (e.g. a schema's ValidationError). Upstream
+    completions are recorded or replayed when LLM_CASSETTE_MODE is set (see
+    llm_cassette.py).
+    """
+    prompt_tokens = token_budget.count_message_tokens(messages, MODEL)
+    model = model_router.route(stage, prompt_tokens)
+    if max_tokens is None:
+        max_tokens = token_budget.completion_budget(stage, prompt_tokens)
+    
+    async def complete():
+        start = time.perf_counter()
+        try:
+            response = await llm_cassette.get_cassette().run(
+                lambda: llm_client.chat_completion(
+                    messages,
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stage=stage,
+                    response_format={"type": "json_object"} if expect_json and LLM_JSON_MODE else None,
+                ),
+                model, messages, temperature, max_tokens, stage=stage,
+            )
+        except Exception:
+            model_router.record(stage, model, time.perf_counter() - start, ok=False)
+            raise
+        model_router.record(stage, model, time.perf_counter() - start, valid=is_json(response) if expect_json else None)
+        return response
+    
+    # Record the call's tokens, latency, retries and cost (see llm_metrics.py)
+    with llm_metrics.track(stage, model):
+        if not use_cache:
+            return await complete()
+
+        cache = llm_cache.get_cache()
+        key = llm_cache.make_key(model, messages, temperature, max_tokens)
+        cached = await cache.get(key)
+        if cached is not None:
+            return cached
+
+        async def fetch():
+            response = await complete()
+            try:
+                if validate:
+                    validate(response)
+                elif expect_json:
+                    structured_output.parse_json(response)
+            except ValueError:
+                return response
+            await cache.set(key, response)
+            return response
+
+        return await _completion_flights.do(key, fetch)
+
+async def call_for_json(messages, schema: Type[BaseModel], stage: str) -> Dict[str, Any]:
+    """Call OpenAI API for a JSON object matching ``schema``.
+
+    Common formatting defects are repaired locally. If fields are then still
+    missing or invalid, the model is asked again for those fields only instead
+    of regenerating the whole response.
+    """
+    # Only replies that match the schema are cached, so a retried stage does not get the same invalid reply
+    response = await call_openai_api(
+        messages, stage=stage, expect_json=True,
+        validate=lambda reply: schema.parse_obj(structured_output.parse_json(reply))
     )
-    return response.choices[0].message.content
+    data = structured_output.parse_json(response)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object from stage {stage}, got {type(data).__name__}")
+    try:
+        return schema.parse_obj(data).dict()
+    except ValidationError as e:
+        fields = structured_output.invalid_fields(e)
+
+    print(f"Stage {stage} returned missing or invalid fields {fields}, asking for them again")
+    reask_messages = messages + [
+        {"role": "assistant", "content": response},
+        {"role": "user", "content": f"""
+            These fields of your JSON response are missing or invalid: {', '.join(fields)}.
+            Respond with a JSON object containing only these fields, in the structure requested above.
+        """}
+    ]
+    patch = structured_output.parse_json(await call_openai_api(reask_messages, stage=stage, expect_json=True, use_cache=False))
+    if isinstance(patch, dict):
+        data.update({field: patch[field] for field in fields if field in patch})
+    return schema.parse_obj(data).dict()
 
 # System prompts
 SYSTEM_PROMPTS = {
@@ -74,9 +192,9 @@ SYSTEM_PROMPTS = {
 }
 
 # Analysis functions
-@cache(expire=3600)  # Cache for 1 hour
 async def analyze_desirable_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Analyze the Desirable dimension of the free model strategy."""
+    inputs = token_budget.fit_fields(inputs, token_budget.FIELD_BUDGETS["dimension"], MODEL)
     messages = [
         {"role": "system", "content": SYSTEM_PROMPTS["desirable_analysis"]},
         {"role": "user", "content": f"""
@@ -101,12 +219,11 @@ async def analyze_desirable_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
         """}
     ]
     
-    response = call_openai_api(messages)
-    return json.loads(response)
+    return await call_for_json(messages, schemas.AnalysisScore, stage="dimension")
 
-@cache(expire=3600)  # Cache for 1 hour
 async def analyze_effective_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Analyze the Effective dimension of the free model strategy."""
+    inputs = token_budget.fit_fields(inputs, token_budget.FIELD_BUDGETS["dimension"], MODEL)
     messages = [
         {"role": "system", "content": SYSTEM_PROMPTS["effective_analysis"]},
         {"role": "user", "content": f"""
@@ -131,12 +248,11 @@ async def analyze_effective_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
         """}
     ]
     
-    response = call_openai_api(messages)
-    return json.loads(response)
+    return await call_for_json(messages, schemas.AnalysisScore, stage="dimension")
 
-@cache(expire=3600)  # Cache for 1 hour
 async def analyze_efficient_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Analyze the Efficient dimension of the free model strategy."""
+    inputs = token_budget.fit_fields(inputs, token_budget.FIELD_BUDGETS["dimension"], MODEL)
     messages = [
         {"role": "system", "content": SYSTEM_PROMPTS["efficient_analysis"]},
         {"role": "user", "content": f"""
@@ -161,12 +277,11 @@ async def analyze_efficient_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
         """}
     ]
     
-    response = call_openai_api(messages)
-    return json.loads(response)
+    return await call_for_json(messages, schemas.AnalysisScore, stage="dimension")
 
-@cache(expire=3600)  # Cache for 1 hour
 async def analyze_polished_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Analyze the Polished dimension of the free model strategy."""
+    inputs = token_budget.fit_fields(inputs, token_budget.FIELD_BUDGETS["dimension"], MODEL)
     messages = [
         {"role": "system", "content": SYSTEM_PROMPTS["polished_analysis"]},
         {"role": "user", "content": f"""
@@ -191,10 +306,8 @@ async def analyze_polished_dimension(inputs: Dict[str, Any]) -> Dict[str, Any]:
         """}
     ]
     
-    response = call_openai_api(messages)
-    return json.loads(response)
+    return await call_for_json(messages, schemas.AnalysisScore, stage="dimension")
 
-@cache(expire=3600)  # Cache for 1 hour
 async def generate_key_findings(dimensional_analyses: Dict[str, Any], context: Dict[str, Any]) -> List[str]:
     """Generate key findings based on the dimensional analyses and context."""
     messages = [
@@ -213,14 +326,14 @@ async def generate_key_findings(dimensional_analyses: Dict[str, Any], context: D
             Efficient: {json.dumps(dimensional_analyses.get('efficient', {}))}
             Polished: {json.dumps(dimensional_analyses.get('polished', {}))}
             
-            Format your response as a JSON array of strings.
+            Format your response as a JSON object with this structure:
+            {{"key_findings": ["finding1", "finding2", ...]}}
         """}
     ]
     
-    response = call_openai_api(messages)
-    return json.loads(response)
+    result = await call_for_json(messages, schemas.KeyFindings, stage="key_findings")
+    return result["key_findings"]
 
-@cache(expire=3600)  # Cache for 1 hour
 async def recommend_free_model_type(analyses: Dict[str, Any], context: Dict[str, Any]) -> str:
     """Recommend a free model type based on the analyses and context."""
     messages = [
@@ -252,11 +365,8 @@ async def recommend_free_model_type(analyses: Dict[str, Any], context: Dict[str,
         """}
     ]
     
-    response = call_openai_api(messages)
-    result = json.loads(response)
-    return result
+    return await call_for_json(messages, schemas.ModelRecommendation, stage="model_recommendation")
 
-@cache(expire=3600)  # Cache for 1 hour
 async def generate_implementation_plan(analyses: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
     """Generate an implementation plan based on the analyses and context."""
     messages = [
@@ -287,31 +397,29 @@ async def generate_implementation_plan(analyses: Dict[str, Any], context: Dict[s
             Also include an overall timeline and list of overall success metrics.
             
             Format your response as a JSON object with this structure:
-            {
-                "phases": {
+            {{
+                "phases": {{
                     "Phase 1": [
-                        {
+                        {{
                             "title": "Step title",
                             "description": "Step description",
                             "priority": "High/Medium/Low",
                             "estimated_effort": "High/Medium/Low",
                             "expected_impact": "High/Medium/Low",
                             "metrics": ["metric1", "metric2"]
-                        },
+                        }},
                         ...
                     ],
                     ...
-                },
+                }},
                 "timeline": "Overall timeline description",
                 "success_metrics": ["metric1", "metric2", ...]
-            }
+            }}
         """}
     ]
     
-    response = call_openai_api(messages)
-    return json.loads(response)
+    return await call_for_json(messages, schemas.ImplementationPlan, stage="implementation_plan")
 
-@cache(expire=3600)  # Cache for 1 hour
 async def generate_recommendations(analyses: Dict[str, Any], context: Dict[str, Any]) -> str:
     """Generate comprehensive recommendations based on the analyses and context."""
     messages = [
@@ -341,11 +449,13 @@ async def generate_recommendations(analyses: Dict[str, Any], context: Dict[str,
         """}
     ]
     
-    response = call_openai_api(messages, max_tokens=2000)
+    response = await call_openai_api(messages, stage="recommendations")
     return response
 
-async def analyze_chat_message(message: str, context: Dict[str, Any]) -> str:
-    """Analyze a chat message and provide a helpful response."""
+def build_chat_messages(message: str, context: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Build the prompt messages for a chat question and its context."""
+    message = token_budget.truncate_text(message, token_budget.FIELD_BUDGETS["chat"], MODEL)
+    
     # Prepare context for the chat
     context_summary = {}
     
@@ -372,62 +482,322 @@ async def analyze_chat_message(message: str, context: Dict[str, Any]) -> str:
             If you don't have enough context to give a specific answer, ask for the necessary information.
         """}
     ]
+    return messages
+
+async def generate_combined_synthesis(analyses: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate key findings, model recommendation, implementation plan and recommendations in one call."""
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPTS["analysis"]},
+        {"role": "user", "content": f"""
+            Based on the following analyses and context, produce a complete synthesis of the free model strategy:
+            
+            Context:
+            Product Description: {context.get('product_description', 'N/A')}
+            Target Audience: {context.get('target_audience', 'N/A')}
+            Business Goals: {context.get('business_goals', 'N/A')}
+            
+            Dimensional Analyses:
+            Desirable: {json.dumps(analyses.get('desirable', {}))}
+            Effective: {json.dumps(analyses.get('effective', {}))}
+            Efficient: {json.dumps(analyses.get('efficient', {}))}
+            Polished: {json.dumps(analyses.get('polished', {}))}
+            
+            Your synthesis must contain:
+            1. key_findings: 5-7 key findings about the free model strategy
+            2. model_recommendation: the most appropriate free model type, chosen from
+               "Freemium", "Free Trial", "Usage-Based", "Community Edition", "Open Core",
+               "Ad-Supported" or "Other" (with explanation)
+            3. implementation_plan: 2-3 phases of 3-5 specific steps each, plus an overall
+               timeline and overall success metrics. Priority, estimated_effort and
+               expected_impact are "High", "Medium" or "Low"
+            4. recommendations: detailed markdown with clear headings and bullet points covering
+               strategic direction, improvements for each DEEP dimension, feature allocation
+               (free vs. paid), conversion triggers and success metrics to track
+            
+            Format your response as a JSON object with this structure:
+            {{
+                "key_findings": ["finding1", "finding2", ...],
+                "model_recommendation": {{"model_type": "Freemium", "explanation": "Why this model fits"}},
+                "implementation_plan": {{
+                    "phases": {{
+                        "Phase 1": [
+                            {{
+                                "title": "Step title",
+                                "description": "Step description",
+                                "priority": "High/Medium/Low",
+                                "estimated_effort": "High/Medium/Low",
+                                "expected_impact": "High/Medium/Low",
+                                "metrics": ["metric1", "metric2"]
+                            }},
+                            ...
+                        ],
+                        ...
+                    }},
+                    "timeline": "Overall timeline description",
+                    "success_metrics": ["metric1", "metric2", ...]
+                }},
+                "recommendations": "Markdown recommendations"
+            }}
+        """}
+    ]
+    
+    # Invalid sections are regenerated by their own stages rather than re-asked here
+    response = await call_openai_api(messages, stage="synthesis", expect_json=True, validate=validate_complete_synthesis)
+    return structured_output.parse_json(response)
+
+def validate_complete_synthesis(response: str):
+    """Raise ValueError unless every section of a combined synthesis matches its schema."""
+    if len(validate_synthesis(structured_output.parse_json(response))) < len(SYNTHESIS_SECTIONS):
+        raise ValueError("Combined synthesis has missing or invalid sections")
+
+def validate_synthesis(synthesis: Dict[str, Any]) -> Dict[str, Any]:
+    """Return only the sections of a combined synthesis that match their schemas."""
+    validators = {
+        "key_findings": lambda value: parse_obj_as(List[str], value),
+        "model_recommendation": lambda value: schemas.ModelRecommendation.parse_obj(value).dict(),
+        "implementation_plan": lambda value: schemas.ImplementationPlan.parse_obj(value).dict(),
+        "recommendations": lambda value: parse_obj_as(str, value),
+    }
     
-    response = call_openai_api(messages, max_tokens=1000)
+    valid = {}
+    for section, validate in validators.items():
+        value = synthesis.get(section) if isinstance(synthesis, dict) else None
+        if not value:
+            continue
+        try:
+            valid[section] = validate(value)
+        except ValidationError:
+            continue
+    return valid
+
+async def analyze_chat_message(message: str, context: Dict[str, Any]) -> str:
+    """Analyze a chat message and provide a helpful response."""
+    messages = build_chat_messages(message, context)
+    # Chat answers are not cached: asking again should give a fresh answer
+    response = await call_openai_api(messages, stage="chat", use_cache=False)
     return response
 
+async def stream_chat_message(message: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+    """Analyze a chat message and stream the response as it is generated."""
+    messages = build_chat_messages(message, context)
+    prompt_tokens = token_budget.count_message_tokens(messages, MODEL)
+    max_tokens = token_budget.completion_budget("chat", prompt_tokens)
+    model = model_router.route("chat", prompt_tokens)
+    # Streams report no usage, so their tokens are counted locally
+    call = llm_metrics.LLMCall("chat", model)
+    upstream = llm_client.stream_chat_completion(messages, model=model, max_tokens=max_tokens, temperature=0.7,
+                                                call=call)
+    completion = ""
+    failed = True
+    try:
+        async for delta in upstream:
+            call.mark_first_byte()
+            completion += delta
+            yield delta
+        failed = False
+    finally:
+        await upstream.aclose()
+        call.add_tokens(prompt_tokens, count_tokens(completion))
+        call.finish(error=failed)
+
+def submission_key(submission: Dict[str, Any], base_result_id: Optional[int] = None) -> str:
+    """Build a canonical hash of a submission, used to detect identical submissions.
+
+    A submission edited from an earlier result reuses that result's stage outputs,
+    so the same submission based on another result (or on none) gets another key.
+    """
+    if base_result_id is not None:
+        submission = {**submission, "base_result_id": base_result_id}
+    canonical = json.dumps(submission, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class StageBroadcast:
+    """Fans the stage outputs of one pipeline run out to every caller waiting on it.
+
+    Listeners that subscribe late are first replayed the outputs published so far.
+    """
+
+    def __init__(self):
+        self.published = []
+        self.listeners = []
+
+    def subscribe(self, listener: StageCallback):
+        for stage, output in self.published:
+            listener(stage, output)
+        self.listeners.append(listener)
+
+    def publish(self, stage: str, output: Any):
+        self.published.append((stage, output))
+        for listener in self.listeners:
+            try:
+                listener(stage, output)
+            except Exception as e:
+                # One caller's failing callback must not break the run for the others
+                print(f"Error publishing stage {stage}: {str(e)}")
+
+_stage_broadcasts: Dict[str, StageBroadcast] = {}
+
 # Main analysis function
-async def analyze_quiz_submission(submission: Dict[str, Any]) -> Dict[str, Any]:
-    """Analyze a complete quiz submission and return comprehensive results."""
+async def analyze_quiz_submission(submission: Dict[str, Any], on_stage: Optional[StageCallback] = None,
+                                  completed: Optional[Dict[str, Any]] = None,
+                                  base_result_id: Optional[int] = None,
+                                  checkpointed: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Analyze a complete quiz submission and return comprehensive results.
+
+    ``on_stage`` is called with each stage's output as soon as it is available,
+    so callers can publish progressive results. Stage outputs in ``completed``
+    are reused instead of recomputed; those of the stages in ``checkpointed``
+    are already stored and not published again. Concurrent calls with an
+    identical submission and ``base_result_id`` share a single pipeline run.
+    """
+    key = submission_key(submission, base_result_id)
+    broadcast = _stage_broadcasts.setdefault(key, StageBroadcast())
+    if on_stage:
+        broadcast.subscribe(on_stage)
+
+    async def run():
+        try:
+            return await run_analysis_pipeline(submission, broadcast.publish, completed, checkpointed)
+        finally:
+            _stage_broadcasts.pop(key, None)
+
+    return await _submission_flights.do(key, run)
+
+DIMENSIONS = ["desirable", "effective", "efficient", "polished"]
+SCORE_WEIGHTS = {"desirable": 0.3, "effective": 0.3, "efficient": 0.2, "polished": 0.2}
+SYNTHESIS_SECTIONS = list(token_budget.SYNTHESIS_SECTIONS)
+# Stages whose outputs are published (and checkpointed) as the analysis progresses
+PUBLISHED_STAGES = DIMENSIONS + ["score"] + SYNTHESIS_SECTIONS
+
+def build_analysis_stages(submission: Dict[str, Any]) -> List[Stage]:
+    """Declare the analysis stages of a submission and the stages each one needs."""
     # Extract context information
     context = {
         "product_description": submission.get("context", {}).get("product_description", ""),
         "target_audience": submission.get("context", {}).get("target_audience", ""),
         "business_goals": submission.get("context", {}).get("business_goals", ""),
     }
-    
-    # Extract DEEP inputs
+    context = token_budget.fit_fields(context, token_budget.FIELD_BUDGETS["context"], MODEL)
     deep_inputs = submission.get("deep_inputs", {})
-    desirable_inputs = deep_inputs.get("desirable", {})
-    effective_inputs = deep_inputs.get("effective", {})
-    efficient_inputs = deep_inputs.get("efficient", {})
-    polished_inputs = deep_inputs.get("polished", {})
     
-    # Analyze each dimension
-    analyses = {}
-    analyses["desirable"] = await analyze_desirable_dimension(desirable_inputs)
-    analyses["effective"] = await analyze_effective_dimension(effective_inputs)
-    analyses["efficient"] = await analyze_efficient_dimension(efficient_inputs)
-    analyses["polished"] = await analyze_polished_dimension(polished_inputs)
+    def llm_stage(name: str, run, inputs) -> Stage:
+        # Retrying while the circuit breaker is open would only fail again
+        return Stage(name, run, inputs, timeout=STAGE_TIMEOUT, retries=STAGE_RETRIES, no_retry=(CircuitOpenError,))
     
-    # Calculate overall score (weighted average)
-    weights = {"desirable": 0.3, "effective": 0.3, "efficient": 0.2, "polished": 0.2}
-    overall_score = sum(analyses[dim]["score"] * weights[dim] for dim in weights)
+    # DEEP dimensions are independent of each other
+    analyzers = {
+        "desirable": analyze_desirable_dimension,
+        "effective": analyze_effective_dimension,
+        "efficient": analyze_efficient_dimension,
+        "polished": analyze_polished_dimension,
+    }
+    stages = [
+        llm_stage(dim, lambda _, analyze=analyze, dim=dim: analyze(deep_inputs.get(dim, {})), [])
+        for dim, analyze in analyzers.items()
+    ]
     
-    # Generate key findings
-    key_findings = await generate_key_findings(analyses, context)
+    async def score(analyses):
+        # Weighted average of the dimension scores
+        return sum(analyses[dim]["score"] * weight for dim, weight in SCORE_WEIGHTS.items())
+    stages.append(Stage("score", score, DIMENSIONS))
     
-    # Recommend free model type
-    model_recommendation = await recommend_free_model_type(analyses, context)
+    # Synthesis sections only depend on the dimension analyses
+    generators = {
+        "key_findings": generate_key_findings,
+        "model_recommendation": recommend_free_model_type,
+        "implementation_plan": generate_implementation_plan,
+        "recommendations": generate_recommendations,
+    }
+    if not COMBINED_SYNTHESIS:
+        stages.extend(
+            llm_stage(section, lambda analyses, generate=generate: generate(analyses, context), DIMENSIONS)
+            for section, generate in generators.items()
+        )
+        return stages
     
-    # Generate implementation plan
-    implementation_plan = await generate_implementation_plan(analyses, context)
+    # One structured completion for all sections; any section that fails
+    # validation is regenerated by its own stage
+    async def combined(analyses):
+        try:
+            return validate_synthesis(await generate_combined_synthesis(analyses, context))
+        except Exception as e:
+            print(f"Combined synthesis failed, falling back to individual stages: {str(e)}")
+            return {}
+    stages.append(Stage("synthesis", combined, DIMENSIONS, timeout=STAGE_TIMEOUT, publish=False))
     
-    # Generate comprehensive recommendations
-    recommendations = await generate_recommendations(analyses, context)
+    def section_stage(section: str, generate) -> Stage:
+        async def run(inputs):
+            if section in inputs["synthesis"]:
+                return inputs["synthesis"][section]
+            return await generate({dim: inputs[dim] for dim in DIMENSIONS}, context)
+        return llm_stage(section, run, DIMENSIONS + ["synthesis"])
+    stages.extend(section_stage(section, generate) for section, generate in generators.items())
+    return stages
+
+def reusable_outputs(submission: Dict[str, Any], base_submission: Dict[str, Any],
+                     base_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the stage outputs of a previous analysis that still hold for an edited submission.
+
+    A dimension analysis only depends on that dimension's inputs, so it is kept
+    when they are unchanged. The synthesis sections depend on every dimension
+    and the context, so they are only kept when nothing they read has changed.
+    """
+    reusable = {}
+    for dim in DIMENSIONS:
+        new_inputs = submission.get("deep_inputs", {}).get(dim)
+        if dim in base_result and new_inputs == base_submission.get("deep_inputs", {}).get(dim):
+            reusable[dim] = base_result[dim]
+    
+    if len(reusable) < len(DIMENSIONS) or submission.get("context") != base_submission.get("context"):
+        return reusable
+    
+    base_sections = {
+        "key_findings": base_result.get("key_findings"),
+        "model_recommendation": {
+            "model_type": base_result.get("recommended_model", ""),
+            "explanation": base_result.get("model_explanation", ""),
+        } if base_result.get("recommended_model") else None,
+        "implementation_plan": base_result.get("implementation_plan"),
+        "recommendations": base_result.get("recommendations"),
+    }
+    reusable.update({section: output for section, output in base_sections.items() if output})
+    return reusable
+
+async def run_analysis_pipeline(submission: Dict[str, Any], on_stage: Optional[StageCallback] = None,
+                                completed: Optional[Dict[str, Any]] = None,
+                                checkpointed: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Run every analysis stage for a submission, each as soon as the stages it needs are done.
+
+    Stages with an output in ``completed`` are not run again; their outputs are
+    published through ``on_stage`` first, like those of the stages that do run,
+    except for the ``checkpointed`` stages whose outputs were published by an earlier attempt.
+    """
+    completed = completed or {}
+    if on_stage:
+        for stage, output in completed.items():
+            if stage not in (checkpointed or []):
+                on_stage(stage, output)
+    # Every stage, and every LLM call in it, has to finish within the analysis deadline
+    with deadlines.deadline(ANALYSIS_DEADLINE):
+        run = await run_pipeline(build_analysis_stages(submission), MAX_PARALLEL_STAGES, on_stage, completed)
+    outputs = run.outputs
+    model_recommendation = outputs["model_recommendation"]
     
     # Compile final result
     result = {
-        "score": overall_score,
-        "desirable": analyses["desirable"],
-        "effective": analyses["effective"],
-        "efficient": analyses["efficient"],
-        "polished": analyses["polished"],
+        "score": outputs["score"],
+        "desirable": outputs["desirable"],
+        "effective": outputs["effective"],
+        "efficient": outputs["efficient"],
+        "polished": outputs["polished"],
         "recommended_model": model_recommendation.get("model_type", ""),
         "model_explanation": model_recommendation.get("explanation", ""),
-        "key_findings": key_findings,
-        "implementation_plan": implementation_plan,
-        "recommendations": recommendations
+        "key_findings": outputs["key_findings"],
+        "implementation_plan": outputs["implementation_plan"],
+        "recommendations": outputs["recommendations"],
+        "stage_timings": run.timings,
+        "stage_tokens": run.tokens,
+        "reused_stages": sorted(completed)
     }
     
-    return result 
\ No newline at end of file
+    return result
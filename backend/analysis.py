@@ -312,4 +312,36 @@ def analyze_quiz_results(answers):
         "key_findings": key_findings
     }
     
-    return analysis 
\ No newline at end of file
+    return analysis 
+
+def submission_answers(submission):
+    """Map a v2 quiz submission onto the question IDs the rule-based scoring reads."""
+    context = submission.get("context") or {}
+    journey = submission.get("user_journey") or {}
+    current = submission.get("current_model") or {}
+    deep_inputs = submission.get("deep_inputs") or {}
+    desirable = deep_inputs.get("desirable") or {}
+    effective = deep_inputs.get("effective") or {}
+    
+    # Free-form fields stand in for the matching legacy questions
+    challenges = journey.get("key_challenges") or {}
+    beginner_challenges = challenges.get("beginner") or []
+    answers = {
+        "product_description": context.get("product_description", ""),
+        "current_free_model": current.get("current_model"),
+        "free_features": desirable.get("value_proposition", ""),
+        "beginner_challenges": ", ".join(beginner_challenges) or journey.get("beginner_stage", ""),
+        "free_limitations": effective.get("friction_points", ""),
+        "key_metrics": effective.get("success_metrics", ""),
+        "main_goals": [line for line in context.get("business_goals", "").splitlines() if line.strip()],
+    }
+    
+    # Structured answers to the quiz questions take precedence
+    for answer in submission.get("structured_answers") or []:
+        answers[answer["question_id"]] = answer["answer"]
+    
+    return [{"question_id": question_id, "answer": answer} for question_id, answer in answers.items()]
+
+def analyze_submission(submission):
+    """Score a v2 quiz submission with the rule-based analyzer, e.g. as a preview of the AI analysis."""
+    return analyze_quiz_results(submission_answers(submission))
@@ -0,0 +1,121 @@
+import os
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", "60"))  # Seconds of recent calls the rates are computed over
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))  # Calls in the window before the breaker can open
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))  # Fraction of failed calls that opens the breaker
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "30"))  # Calls slower than this count as slow
+CIRCUIT_SLOW_RATE = float(os.getenv("CIRCUIT_SLOW_RATE", "0.5"))  # Fraction of slow calls that opens the breaker
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))  # How long the breaker stays open before probing
+# What an analysis does when the breaker stops its LLM calls: "degrade" to rule-based
+# scoring flagged as degraded, or "fail" so the job is retried later
+CIRCUIT_OPEN_POLICY = os.getenv("CIRCUIT_OPEN_POLICY", "degrade").lower()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"LLM circuit breaker is open, retry in {retry_after:.0f}s")
+
+class CircuitBreaker:
+    """Stop calling an upstream that is failing or too slow.
+
+    Outcomes of recent calls are kept for ``window`` seconds. Once there are at
+    least ``min_calls`` of them and the share of errors or of calls slower than
+    ``slow_call_seconds`` reaches its threshold, the breaker opens: calls fail
+    immediately with CircuitOpenError for ``open_seconds``. Then a single probe
+    call is let through; its outcome closes the breaker or opens it again.
+    """
+
+    def __init__(self, window: float = CIRCUIT_WINDOW, min_calls: int = CIRCUIT_MIN_CALLS,
+                 error_rate: float = CIRCUIT_ERROR_RATE, slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS,
+                 slow_rate: float = CIRCUIT_SLOW_RATE, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.calls: Deque[Tuple[float, bool, bool]] = deque()  # (finished at, failed, slow)
+        self.rejected = 0  # Calls refused while open
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe call through."""
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError if a call must not be made now. Returns whether the call is the probe."""
+        if self.state == OPEN and self.retry_after() <= 0:
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == OPEN or (self.state == HALF_OPEN and self.probing):
+            self.rejected += 1
+            raise CircuitOpenError(self.retry_after() or self.open_seconds)
+        if self.state == HALF_OPEN:
+            self.probing = True
+            return True
+        return False
+
+    def release(self, probe: bool):
+        """Give back the probe slot of a call that ended without an outcome, e.g. because it was cancelled."""
+        if probe and self.state == HALF_OPEN:
+            self.probing = False
+
+    def record(self, duration: float, failed: bool, probe: bool = False):
+        """Record the outcome of a call made after before_call (not of cancelled calls, see release).
+
+        ``probe`` is what before_call returned. While half-open only the probe decides the
+        state: calls still in flight from before the breaker opened are ignored.
+        """
+        slow = duration >= self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            if not probe:
+                return
+            self.probing = False
+            if failed or slow:
+                self._open()
+            else:
+                self.state = CLOSED
+                self.calls.clear()
+            return
+
+        now = time.monotonic()
+        self.calls.append((now, failed, slow))
+        while self.calls and self.calls[0][0] < now - self.window:
+            self.calls.popleft()
+        if self.state == CLOSED and len(self.calls) >= self.min_calls:
+            errors = sum(1 for _, call_failed, _ in self.calls if call_failed)
+            slow_calls = sum(1 for _, _, call_slow in self.calls if call_slow)
+            if errors / len(self.calls) >= self.error_rate or slow_calls / len(self.calls) >= self.slow_rate:
+                self._open()
+
+    def _open(self):
+        print(f"LLM circuit breaker opened for {self.open_seconds:.0f}s")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.calls.clear()
+
+    def is_open(self) -> bool:
+        return self.state == OPEN and self.retry_after() > 0
+
+_breaker: Optional[CircuitBreaker] = None
+
+def get_breaker() -> CircuitBreaker:
+    """Get the circuit breaker guarding LLM calls made by this process."""
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker()
+    return _breaker
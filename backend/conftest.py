@@ -0,0 +1,16 @@
+import pytest
+import token_budget
+
+class WordEncoder:
+    """Stand-in for a tiktoken encoder with one token per word, so tests need no downloaded encodings."""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    """Count tokens as whitespace-separated words."""
+    monkeypatch.setattr(token_budget, "get_encoder", lambda model=None: WordEncoder())
@@ -56,7 +56,7 @@ def get_user_projects(db: Session, user_id: str, skip: int = 0, limit: int = 100
     return user.projects[skip:skip+limit]
 
 # Quiz result operations
-def create_quiz_result(db: Session, quiz_result: schemas.QuizResultCreate, user_id: str, project_id: Optional[int] = None):
+def create_quiz_result(db: Session, quiz_result: schemas.QuizResultCreate, user_id: str, project_id: Optional[int] = None, version: int = 1, is_provisional: bool = False):
     """Create a new quiz result"""
     db_quiz_result = models.QuizResult(
         user_id=user_id,
@@ -98,24 +98,40 @@ def create_quiz_result(db: Session, quiz_result: schemas.QuizResultCreate, user_
         polished_score=quiz_result.polished_score,
         
         # Recommendations
-        recommended_model=quiz_result.recommended_model
+        recommended_model=quiz_result.recommended_model,
+        
+        # Metadata
+        version=version,
+        is_provisional=is_provisional
     )
     db.add(db_quiz_result)
     db.commit()
     db.refresh(db_quiz_result)
     return db_quiz_result
 
-def create_quiz_result_with_task_id(db: Session, quiz_result: schemas.QuizResultCreate, user_id: str, task_id: str, project_id: Optional[int] = None):
-    """Create a new quiz result with a task ID for background processing tracking"""
-    # Create the quiz result
-    db_quiz_result = create_quiz_result(db, quiz_result, user_id, project_id)
-    
-    # Store the task ID in a separate table (this would be implemented in a real system)
-    # For demo purposes, we'll use a simple Redis-based approach
-    
-    # In a real implementation, you would associate the task ID with the result
-    # Task tracking would typically be done with a separate table or Redis
-    
+def update_quiz_result(db: Session, quiz_result_id: int, quiz_result: schemas.QuizResultCreate, **fields):
+    """Replace the contents of a quiz result, e.g. a provisional result with the final analysis"""
+    db_quiz_result = get_quiz_result(db, quiz_result_id)
+    if not db_quiz_result:
+        return None
+    for field, value in {**quiz_result.dict(), **fields}.items():
+        setattr(db_quiz_result, field, value)
+    db.commit()
+    db.refresh(db_quiz_result)
+    return db_quiz_result
+
+def create_quiz_result_with_task_id(db: Session, quiz_result: schemas.QuizResultCreate, user_id: str, task_id: str, project_id: Optional[int] = None, version: int = 1):
+    """Save the final quiz result of an analysis task and mark the task as completed.
+
+    A provisional result already linked to the task is updated in place, so its ID stays valid.
+    """
+    task = get_analysis_task(db, task_id)
+    db_quiz_result = None
+    if task and task.result_id is not None:
+        db_quiz_result = update_quiz_result(db, task.result_id, quiz_result, is_provisional=False)
+    if db_quiz_result is None:
+        db_quiz_result = create_quiz_result(db, quiz_result, user_id, project_id, version)
+    update_analysis_task(db, task_id, status="completed", stage=None, error=None, result_id=db_quiz_result.id)
     return db_quiz_result
 
 def get_quiz_result(db: Session, quiz_result_id: int):
@@ -123,15 +139,27 @@ def get_quiz_result(db: Session, quiz_result_id: int):
     return db.query(models.QuizResult).filter(models.QuizResult.id == quiz_result_id).first()
 
 def get_quiz_result_by_task_id(db: Session, task_id: str):
-    """Get a quiz result by task ID (for background processing)"""
-    # In a real implementation, you would look up the task ID in your tracking system
-    # For demo purposes, we'll assume a successful completion
-    
-    # This is a mock implementation - in a real system, you would query a task tracking table
-    # or Redis for the associated quiz result ID
-    
-    # Return the most recent result for now (this is just for demo purposes)
-    return db.query(models.QuizResult).order_by(models.QuizResult.created_at.desc()).first()
+    """Get the quiz result of an analysis task (provisional until the task completes)"""
+    task = get_analysis_task(db, task_id)
+    if not task or task.result_id is None:
+        return None
+    return get_quiz_result(db, quiz_result_id=task.result_id)
+
+def discard_provisional_result(db: Session, task_id: str):
+    """Delete the provisional result of an analysis task that will not complete, unlinking it from the task"""
+    task = get_analysis_task(db, task_id)
+    if not task or task.result_id is None:
+        return
+    db_quiz_result = get_quiz_result(db, task.result_id)
+    if db_quiz_result is None or not db_quiz_result.is_provisional:
+        return
+    task.result_id = None
+    # Chats started on the preview stay, without their result context
+    db.query(models.ChatSession).filter(
+        models.ChatSession.quiz_result_id == db_quiz_result.id
+    ).update({models.ChatSession.quiz_result_id: None}, synchronize_session=False)
+    db.delete(db_quiz_result)
+    db.commit()
 
 def get_user_quiz_results(db: Session, user_id: str, skip: int = 0, limit: int = 100):
     """Get all quiz results for a user"""
@@ -145,6 +173,89 @@ def get_project_quiz_results(db: Session, project_id: int, skip: int = 0, limit:
         models.QuizResult.project_id == project_id
     ).order_by(models.QuizResult.created_at.desc()).offset(skip).limit(limit).all()
 
+# Analysis task operations
+def create_analysis_task(db: Session, task_id: str, user_id: str, input_hash: Optional[str] = None, result_id: Optional[int] = None):
+    """Create a pending analysis task, optionally linked to its provisional result"""
+    db_task = models.AnalysisTask(
+        task_id=task_id,
+        user_id=user_id,
+        status="pending",
+        input_hash=input_hash,
+        result_id=result_id
+    )
+    db.add(db_task)
+    db.commit()
+    db.refresh(db_task)
+    return db_task
+
+def get_analysis_task(db: Session, task_id: str):
+    """Get an analysis task by its task ID (primary key lookup)"""
+    return db.query(models.AnalysisTask).filter(models.AnalysisTask.task_id == task_id).first()
+
+def get_active_task_by_input_hash(db: Session, user_id: str, input_hash: str):
+    """Get a user's pending or processing analysis task for an identical submission, if any"""
+    return db.query(models.AnalysisTask).filter(
+        models.AnalysisTask.input_hash == input_hash,
+        models.AnalysisTask.user_id == user_id,
+        models.AnalysisTask.status.in_(["pending", "processing"])
+    ).first()
+
+def count_active_tasks(db: Session, user_id: str) -> int:
+    """Count a user's analysis tasks that are pending or processing"""
+    return db.query(models.AnalysisTask).filter(
+        models.AnalysisTask.user_id == user_id,
+        models.AnalysisTask.status.in_(["pending", "processing"])
+    ).count()
+
+def update_analysis_task(db: Session, task_id: str, **fields):
+    """Update the status, stage, error or result of an analysis task"""
+    task = get_analysis_task(db, task_id)
+    if not task:
+        return None
+    for field, value in fields.items():
+        setattr(task, field, value)
+    db.commit()
+    db.refresh(task)
+    return task
+
+def save_stage_result(db: Session, task_id: str, stage: str, output: Any):
+    """Store the output of a completed analysis stage, replacing any earlier output of the same stage"""
+    previous = db.query(models.AnalysisStageResult).filter(
+        models.AnalysisStageResult.task_id == task_id,
+        models.AnalysisStageResult.stage == stage
+    ).first()
+    if previous:
+        # A replaced output gets a new, higher ID so SSE clients resuming after the old one receive it.
+        # Move the old row aside before inserting (SQLite would reuse its ID if it were deleted first).
+        previous.stage = f"{stage}:replaced"
+        db.flush()
+    db_stage_result = models.AnalysisStageResult(
+        task_id=task_id,
+        stage=stage,
+        output=output
+    )
+    db.add(db_stage_result)
+    db.flush()
+    if previous:
+        db.delete(previous)
+    db.commit()
+    db.refresh(db_stage_result)
+    return db_stage_result
+
+def get_stage_results(db: Session, task_id: str, after_id: int = 0):
+    """Get the stage outputs of an analysis task in completion order, optionally only those after a given ID"""
+    return db.query(models.AnalysisStageResult).filter(
+        models.AnalysisStageResult.task_id == task_id,
+        models.AnalysisStageResult.id > after_id
+    ).order_by(models.AnalysisStageResult.id.asc()).all()
+
+def get_completed_stages(db: Session, task_id: str) -> List[str]:
+    """Get the names of the stages of an analysis task that have a stored output, in completion order"""
+    rows = db.query(models.AnalysisStageResult.stage).filter(
+        models.AnalysisStageResult.task_id == task_id
+    ).order_by(models.AnalysisStageResult.id.asc()).all()
+    return [row.stage for row in rows]
+
 # Chat operations
 def create_chat_session(db: Session, user_id: str, quiz_result_id: Optional[int] = None):
     """Create a new chat session"""
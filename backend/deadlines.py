@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Absolute time (time.monotonic) by which the work of the current context must be done
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    """Raised when work is started after its deadline has passed."""
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Run the block with a deadline ``seconds`` from now, or the enclosing one if that is sooner."""
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline (never negative), or None without one."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return max(0.0, at - time.monotonic())
+
+def expired() -> bool:
+    return remaining() == 0.0
+
+def check():
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    if expired():
+        raise DeadlineExceeded("Deadline exceeded")
+
+def cap(timeout: Optional[float]) -> Optional[float]:
+    """Limit a timeout to the time left until the current deadline."""
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from dotenv import load_dotenv
+import llm_metrics
+
+# Load environment variables
+load_dotenv()
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))  # Latency after which a duplicate is sent
+LLM_HEDGE_MAX_FRACTION = float(os.getenv("LLM_HEDGE_MAX_FRACTION", "0.05"))  # Max hedged share of requests
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # Latencies needed before hedging a stage
+LATENCY_SAMPLES = 200  # Recent latencies kept per stage
+
+class LatencyTracker:
+    """Recent request latencies per stage."""
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        self.samples = samples
+        self.latencies: Dict[str, Deque[float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        self.latencies.setdefault(stage, deque(maxlen=self.samples)).append(seconds)
+
+    def percentile(self, stage: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Latency below which ``percentile`` percent of the stage's recent requests completed."""
+        latencies = self.latencies.get(stage)
+        if not latencies or len(latencies) < min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+class Hedger:
+    """Send a duplicate of a slow request and keep whichever response arrives first.
+
+    A request to a stage that has not answered within the stage's recent
+    ``percentile`` latency gets one duplicate, as long as duplicates stay under
+    ``max_fraction`` of all requests. The slower request is cancelled.
+    """
+
+    def __init__(self, enabled: bool = LLM_HEDGE_ENABLED, percentile: float = LLM_HEDGE_PERCENTILE,
+                 max_fraction: float = LLM_HEDGE_MAX_FRACTION, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self.hedges = 0  # Duplicates sent
+        self.hedge_wins = 0  # Duplicates that answered first
+        self.hedge_tokens = 0  # Tokens reserved for duplicates, i.e. their cost
+
+    async def run(self, stage: Optional[str], call: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        """Await ``call()``, hedging it with a second ``call()`` if it is slow.
+
+        ``tokens`` is the estimated cost of one call, counted for every duplicate sent.
+        """
+        self.requests += 1
+        stage = stage or "default"
+
+        async def timed(duplicate: bool = False):
+            # Failed requests count too, and so does an original request cancelled because its duplicate won
+            # (it took at least that long), or the slowest requests would be missing from the percentile.
+            # A cancelled duplicate started late, so its time says nothing about the latency.
+            start = time.perf_counter()
+            cancelled = False
+            try:
+                return await call()
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+            finally:
+                if not (cancelled and duplicate):
+                    self.latency.record(stage, time.perf_counter() - start)
+
+        delay = self.latency.percentile(stage, self.percentile, self.min_samples) if self.enabled else None
+        if delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or self.hedges >= self.max_fraction * self.requests:
+            return await primary
+
+        self.hedges += 1
+        self.hedge_tokens += tokens
+        llm_metrics.record_hedge(stage, tokens)
+        hedge = asyncio.ensure_future(timed(duplicate=True))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                            llm_metrics.LLM_HEDGE_WINS.labels(stage=stage).inc()
+                        return task.result()
+                if not pending:
+                    # Both failed: report the original request's error
+                    return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            for task in (primary, hedge):
+                # Mark exceptions of the losing request as retrieved
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_tokens": self.hedge_tokens,
+            "hedge_ratio": self.hedges / self.requests if self.requests else 0.0,
+        }
+
+_hedger: Optional[Hedger] = None
+
+def get_hedger() -> Hedger:
+    """Get the hedger used for LLM requests made by this process."""
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+    return _hedger
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Any, Iterator, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "./job_queue.db")
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))  # Seconds a claimed job stays hidden
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "10"))  # Base delay before a failed job is retried
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    queue TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    visible_at REAL NOT NULL,
+    lease_id TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (queue, status, visible_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_finished ON jobs (queue, status, finished_at);
+"""
+
+@dataclass
+class Job:
+    id: str
+    queue: str
+    payload: Dict[str, Any]
+    attempts: int
+    lease_id: str
+
+class JobQueue:
+    """Durable job queue stored in a local SQLite file.
+
+    Jobs move from ``queued`` to ``running`` when claimed. A claimed job stays
+    invisible to other workers until its lease (visibility timeout) expires, so
+    a job held by a crashed worker is picked up again. Workers acknowledge
+    finished jobs, or nack failed ones to have them retried with backoff until
+    ``max_attempts`` is reached, after which they are marked ``dead``.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, retry_delay: float = JOB_RETRY_DELAY):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Autocommit mode (isolation_level=None) lets claim() issue BEGIN IMMEDIATE itself
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, queue: str, payload: Dict[str, Any], job_id: Optional[str] = None, delay: float = 0) -> str:
+        """Add a job to a queue and return its ID."""
+        job_id = job_id or str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, queue, payload, status, visible_at, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, queue, json.dumps(payload), now + delay, now)
+            )
+        return job_id
+
+    def claim(self, queue: str) -> Optional[Job]:
+        """Claim the next visible job, or return None if there is nothing to do.
+
+        Running jobs whose lease has expired are claimable again.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # Take the write lock up front so two workers cannot claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE queue = ? AND status IN ('queued', 'running') AND visible_at <= ? "
+                    "ORDER BY visible_at LIMIT 1",
+                    (queue, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                lease_id = str(uuid.uuid4())
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_id = ?, visible_at = ?, "
+                    "started_at = ? WHERE id = ?",
+                    (lease_id, now + self.visibility_timeout, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return Job(
+            id=row["id"],
+            queue=row["queue"],
+            payload=json.loads(row["payload"]),
+            attempts=row["attempts"] + 1,
+            lease_id=lease_id
+        )
+
+    def extend(self, job: Job, seconds: Optional[float] = None) -> bool:
+        """Push back a running job's visibility timeout. Returns False if the lease was lost."""
+        visible_at = time.time() + (seconds or self.visibility_timeout)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET visible_at = ? WHERE id = ? AND lease_id = ? AND status = 'running'",
+                (visible_at, job.id, job.lease_id)
+            )
+        return cursor.rowcount == 1
+
+    def ack(self, job: Job) -> bool:
+        """Mark a job as done. Returns False if the lease was lost to another worker."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ? AND lease_id = ?",
+                (time.time(), job.id, job.lease_id)
+            )
+        return cursor.rowcount == 1
+
+    def nack(self, job: Job, error: str) -> bool:
+        """Release a failed job for retry with exponential backoff.
+
+        Returns True if the job will be retried, False if it is now dead.
+        """
+        now = time.time()
+        if job.attempts >= self.max_attempts:
+            self.dead(job, error)
+            return False
+        delay = self.retry_delay * (2 ** (job.attempts - 1))
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', visible_at = ?, last_error = ?, lease_id = NULL "
+                "WHERE id = ? AND lease_id = ?",
+                (now + delay, error, job.id, job.lease_id)
+            )
+        return True
+
+    def dead(self, job: Job, error: str):
+        """Give up on a job for good."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', last_error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job.id)
+            )
+
+    def counts(self, queue: str) -> Dict[str, int]:
+        """Number of jobs waiting (``queued``) and being worked on (``running``) in a queue."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT "
+                "SUM(CASE WHEN status = 'queued' OR (status = 'running' AND visible_at <= ?) THEN 1 ELSE 0 END), "
+                "SUM(CASE WHEN status = 'running' AND visible_at > ? THEN 1 ELSE 0 END) "
+                "FROM jobs WHERE queue = ? AND status IN ('queued', 'running')",
+                (now, now, queue)
+            ).fetchone()
+        return {"queued": row[0] or 0, "running": row[1] or 0}
+
+    def recent_duration(self, queue: str, sample: int = 50) -> Optional[float]:
+        """Average run time in seconds of the most recently completed jobs, or None without history."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT AVG(finished_at - started_at) FROM ("
+                "SELECT started_at, finished_at FROM jobs WHERE queue = ? AND status = 'done' "
+                "ORDER BY finished_at DESC LIMIT ?)",
+                (queue, sample)
+            ).fetchone()
+        return row[0]
+
+_queue: Optional[JobQueue] = None
+
+def get_queue() -> JobQueue:
+    """Get the process-wide job queue."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+from dotenv import load_dotenv
+import metrics
+
+# Load environment variables
+load_dotenv()
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))  # Seconds a cached completion stays valid
+LLM_CACHE_L1_SIZE = int(os.getenv("LLM_CACHE_L1_SIZE", "1024"))  # Max completions kept in process memory
+LLM_CACHE_L2 = os.getenv("LLM_CACHE_L2", "none").lower()  # "redis", "disk" or "none"
+LLM_CACHE_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379"))
+LLM_CACHE_REDIS_TIMEOUT = float(os.getenv("LLM_CACHE_REDIS_TIMEOUT", "0.1"))  # A slow Redis counts as a miss
+LLM_CACHE_DISK_PATH = os.getenv("LLM_CACHE_DISK_PATH", "./llm_cache.db")
+LLM_CACHE_DISK_SIZE = int(os.getenv("LLM_CACHE_DISK_SIZE", "20000"))  # Max completions kept on disk
+
+def normalize_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Normalize prompt messages so formatting-only differences map to the same key."""
+    return [
+        {"role": message["role"], "content": " ".join(message["content"].split())}
+        for message in messages
+    ]
+
+def make_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """Build a content-addressed cache key for a completion request."""
+    canonical = json.dumps(
+        {
+            "model": model,
+            "messages": normalize_messages(messages),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """Bounded in-process cache with per-entry expiry."""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisCache:
+    """Shared L2 cache in Redis. Errors and timeouts are treated as misses."""
+
+    def __init__(self, url: str, ttl: int, timeout: float):
+        import redis.asyncio as aioredis
+        self.redis = aioredis.from_url(url)
+        self.ttl = ttl
+        self.timeout = timeout
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            value = await asyncio.wait_for(self.redis.get(f"llm-cache:{key}"), self.timeout)
+        except Exception:
+            return None
+        return value.decode("utf-8") if value is not None else None
+
+    async def set(self, key: str, value: str):
+        try:
+            await asyncio.wait_for(self.redis.set(f"llm-cache:{key}", value, ex=self.ttl), self.timeout)
+        except Exception:
+            pass
+
+class DiskCache:
+    """L2 cache in a local SQLite file, shared by the processes on a host.
+
+    Entries expire after the TTL, and the least recently used entries are
+    evicted once the file holds more than ``max_size`` completions.
+    """
+
+    def __init__(self, path: str, ttl: int, max_size: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_completions_used_at ON completions (used_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT value FROM completions WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE completions SET used_at = ? WHERE key = ?", (now, key))
+            return row[0] if row is not None else None
+        finally:
+            conn.close()
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now + self.ttl, now)
+                )
+                conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM completions WHERE key IN ("
+                    "SELECT key FROM completions ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,)
+                )
+        finally:
+            conn.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except sqlite3.Error:
+            return None
+
+    async def set(self, key: str, value: str):
+        try:
+            await asyncio.to_thread(self._set, key, value)
+        except sqlite3.Error:
+            pass
+
+class LLMCache:
+    """Two-tier completion cache: in-process LRU (L1) in front of an optional shared L2."""
+
+    def __init__(self, l1: LRUCache, l2=None):
+        self.l1 = l1
+        self.l2 = l2
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0}
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.l1.get(key)
+        if value is not None:
+            self._count("l1_hits")
+            return value
+        if self.l2 is not None:
+            value = await self.l2.get(key)
+            if value is not None:
+                self._count("l2_hits")
+                self.l1.set(key, value)
+                return value
+        self._count("misses")
+        return None
+
+    def _count(self, result: str):
+        self.counters[result] += 1
+        metrics.CACHE_LOOKUPS.labels(cache="llm", result=result).inc()
+
+    async def set(self, key: str, value: str):
+        self.l1.set(key, value)
+        if self.l2 is not None:
+            await self.l2.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, the overall hit ratio and that of each tier (L2 over the L1 misses)."""
+        lookups = sum(self.counters.values())
+        hits = self.counters["l1_hits"] + self.counters["l2_hits"]
+        l2_lookups = self.counters["l2_hits"] + self.counters["misses"] if self.l2 is not None else 0
+        return {
+            **self.counters,
+            "l1_size": len(self.l1),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "l1_hit_ratio": self.counters["l1_hits"] / lookups if lookups else 0.0,
+            "l2_hit_ratio": self.counters["l2_hits"] / l2_lookups if l2_lookups else 0.0,
+        }
+
+_cache: Optional[LLMCache] = None
+
+def get_cache() -> LLMCache:
+    """Get the process-wide LLM cache, configured from the LLM_CACHE_* settings."""
+    global _cache
+    if _cache is None:
+        l2 = None
+        if LLM_CACHE_L2 == "redis":
+            l2 = RedisCache(LLM_CACHE_REDIS_URL, LLM_CACHE_TTL, LLM_CACHE_REDIS_TIMEOUT)
+        elif LLM_CACHE_L2 == "disk":
+            l2 = DiskCache(LLM_CACHE_DISK_PATH, LLM_CACHE_TTL, LLM_CACHE_DISK_SIZE)
+        _cache = LLMCache(LRUCache(LLM_CACHE_L1_SIZE, LLM_CACHE_TTL), l2)
+    return _cache
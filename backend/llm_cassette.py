@@ -0,0 +1,184 @@
+"""Record/replay cassettes for LLM calls.
+
+With LLM_CASSETTE_MODE=record, every upstream completion made through
+ai_analysis.call_openai_api is appended to a gzipped JSON Lines archive
+together with its latency and token usage. With LLM_CASSETTE_MODE=replay the
+recorded responses are served back instead, after the recorded latency times
+LLM_CASSETTE_TIME_SCALE (0 for no delay), so production-shaped workloads can
+be re-run offline through the real pipeline, cache and scheduler.
+
+Entries are looked up by the completion cache key (llm_cache.make_key), and
+by the prompt alone when the model or completion size changed since the
+recording. A key recorded several times is replayed in recording order.
+
+Summarize a cassette (from the backend directory) with:
+
+    python -m llm_cassette ./llm_cassette.jsonl.gz --slowest 10
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import atexit
+import asyncio
+import argparse
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+# Make the backend modules importable when started as `python -m backend.llm_cassette`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_cache
+import llm_client
+
+# Load environment variables
+load_dotenv()
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()  # "record", "replay" or "off"
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "./llm_cassette.jsonl.gz")
+LLM_CASSETTE_TIME_SCALE = float(os.getenv("LLM_CASSETTE_TIME_SCALE", "1"))  # Replayed latency multiplier
+FLUSH_EVERY = 50  # Recorded entries buffered before they are written out
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request that is not in the cassette."""
+
+def prompt_key(messages: List[Dict[str, str]]) -> str:
+    """Key of the prompt alone, used when the exact request was not recorded."""
+    return llm_cache.make_key("", messages, 0, 0)
+
+def read_entries(path: str) -> List[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class Cassette:
+    """Records upstream LLM completions to, or replays them from, a cassette file."""
+
+    def __init__(self, mode: str = LLM_CASSETTE_MODE, path: str = LLM_CASSETTE_PATH,
+                 time_scale: float = LLM_CASSETTE_TIME_SCALE):
+        if mode not in ("record", "replay", "off"):
+            raise ValueError(f"Unknown LLM_CASSETTE_MODE: {mode}")
+        self.mode = mode
+        self.path = path
+        self.time_scale = time_scale
+        self._buffer: List[str] = []
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._played: Dict[str, int] = {}
+        self.counters = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == "replay":
+            for entry in read_entries(path):
+                self._entries.setdefault(entry["key"], []).append(entry)
+                self._entries.setdefault(entry["prompt_key"], []).append(entry)
+        elif mode == "record":
+            atexit.register(self.flush)
+
+    async def run(self, call: Callable[[], Awaitable[str]], model: str, messages: List[Dict[str, str]],
+                  temperature: float, max_tokens: int, stage: Optional[str] = None) -> str:
+        """Make the upstream completion ``call()``, recording or replaying it depending on the mode."""
+        if self.mode == "off":
+            return await call()
+        key = llm_cache.make_key(model, messages, temperature, max_tokens)
+        if self.mode == "replay":
+            return await self._replay(key, prompt_key(messages), stage)
+
+        # Record the call's own token usage, and still report it to the enclosing recorder
+        outer = llm_client.usage_recorder.get()
+        usage: Dict[str, int] = {}
+        token = llm_client.usage_recorder.set(usage)
+        start = time.perf_counter()
+        try:
+            response = await call()
+        finally:
+            llm_client.usage_recorder.reset(token)
+            if outer is not None:
+                for name, count in usage.items():
+                    outer[name] = outer.get(name, 0) + count
+        self._append({
+            "key": key,
+            "prompt_key": prompt_key(messages),
+            "stage": stage,
+            "model": model,
+            "response": response,
+            "latency": round(time.perf_counter() - start, 3),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "recorded_at": time.time(),
+        })
+        return response
+
+    async def _replay(self, key: str, fallback_key: str, stage: Optional[str]) -> str:
+        lookup = key if key in self._entries else fallback_key
+        entries = self._entries.get(lookup)
+        if not entries:
+            self.counters["misses"] += 1
+            raise CassetteMiss(f"No recorded completion for this {stage or 'default'} request in {self.path}")
+        # Replay repeated requests in recording order, then keep serving the last recording
+        played = self._played.get(lookup, 0)
+        self._played[lookup] = played + 1
+        entry = entries[min(played, len(entries) - 1)]
+        if self.time_scale > 0:
+            await asyncio.sleep(entry["latency"] * self.time_scale)
+        llm_client.record_usage(entry["prompt_tokens"], entry["completion_tokens"])
+        self.counters["replayed"] += 1
+        return entry["response"]
+
+    def _append(self, entry: Dict[str, Any]):
+        self._buffer.append(json.dumps(entry, separators=(",", ":")))
+        self.counters["recorded"] += 1
+        if len(self._buffer) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """Write buffered entries out as one gzip member, in a single append so processes can share the file."""
+        if not self._buffer:
+            return
+        data = gzip.compress(("\n".join(self._buffer) + "\n").encode("utf-8"))
+        self._buffer = []
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+_cassette: Optional[Cassette] = None
+
+def get_cassette() -> Cassette:
+    """Get the cassette used by this process, configured from the LLM_CASSETTE_* settings."""
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette()
+    return _cassette
+
+def summarize(entries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Calls, latency percentiles and token totals per stage and model."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        groups.setdefault(f"{entry['stage'] or 'default'}:{entry['model']}", []).append(entry)
+    summary = {}
+    for name, group in sorted(groups.items()):
+        latencies = sorted(entry["latency"] for entry in group)
+        summary[name] = {
+            "calls": len(group),
+            "p50_latency": latencies[len(latencies) // 2],
+            "p95_latency": latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)],
+            "prompt_tokens": sum(entry["prompt_tokens"] for entry in group),
+            "completion_tokens": sum(entry["completion_tokens"] for entry in group),
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a recorded LLM cassette")
+    parser.add_argument("path", nargs="?", default=LLM_CASSETTE_PATH)
+    parser.add_argument("--slowest", type=int, default=0, help="Also list the N slowest calls")
+    args = parser.parse_args()
+
+    entries = read_entries(args.path)
+    print(f"{len(entries)} calls in {args.path}\n")
+    print(f"{'Stage:model':<40} {'calls':>7} {'p50 s':>8} {'p95 s':>8} {'prompt tok':>11} {'compl tok':>10}")
+    for name, row in summarize(entries).items():
+        print(f"{name:<40} {row['calls']:>7} {row['p50_latency']:>8.2f} {row['p95_latency']:>8.2f} "
+              f"{row['prompt_tokens']:>11} {row['completion_tokens']:>10}")
+    if args.slowest:
+        print(f"\nSlowest {args.slowest} calls:")
+        for entry in sorted(entries, key=lambda entry: entry["latency"], reverse=True)[:args.slowest]:
+            print(f"  {entry['latency']:>7.2f}s  {entry['stage'] or 'default'}:{entry['model']}  "
+                  f"{entry['completion_tokens']} tokens  {entry['response'][:60]!r}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+import httpx
+from contextvars import ContextVar
+from typing import Dict, List, Optional, AsyncIterator
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, APIConnectionError, RateLimitError, InternalServerError
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, stop_any, wait_random_exponential
+import rate_limiter
+import token_budget
+import circuit_breaker
+import deadlines
+import hedging
+import llm_metrics
+
+# Load environment variables
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # e.g. http://localhost:8001/v1 for mock_llm_server.py
+
+# Connection pool settings - one pool is shared by every call made by this process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))  # Seconds per request
+
+# Retry settings
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "6"))
+LLM_RETRY_MAX_WAIT = float(os.getenv("LLM_RETRY_MAX_WAIT", "60"))
+
+# Errors worth retrying: network failures/timeouts, rate limits and 5xx responses.
+# Anything else (bad request, auth, an open circuit breaker) fails the same way on every attempt.
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+# Token usage of the calls made in the current context is added to this dict when set
+# (the pipeline sets one per stage to account tokens to it)
+usage_recorder: ContextVar[Optional[Dict[str, int]]] = ContextVar("usage_recorder", default=None)
+
+_client: Optional[AsyncOpenAI] = None
+
+async def _mark_sent(request: httpx.Request):
+    request.extensions["sent_at"] = time.perf_counter()
+
+async def _record_first_byte(response: httpx.Response):
+    """Record the time until the response headers arrived, before its body is read."""
+    sent_at = response.request.extensions.get("sent_at")
+    if sent_at is not None and response.is_success:
+        llm_metrics.record_response(time.perf_counter() - sent_at)
+
+def get_client() -> AsyncOpenAI:
+    """Get the shared async OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=LLM_TIMEOUT,
+            event_hooks={"request": [_mark_sent], "response": [_record_first_byte]},
+        )
+        # Retries are handled below so they are visible and configurable in one place
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            http_client=http_client,
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+        )
+    return _client
+
+async def close_client():
+    """Close the shared client and its connection pool (call on shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+def record_usage(prompt_tokens: int, completion_tokens: int):
+    """Add token usage to the recorder of the current context, if any."""
+    usage = usage_recorder.get()
+    if usage is not None:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt_tokens
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion_tokens
+    llm_metrics.record_tokens(prompt_tokens, completion_tokens)
+
+def retrying() -> AsyncRetrying:
+    """Build the retry policy used for every LLM request.
+
+    Retries stop at the current deadline, and never wait past it.
+    """
+    backoff = wait_random_exponential(min=1, max=LLM_RETRY_MAX_WAIT)
+    return AsyncRetrying(
+        wait=lambda retry_state: deadlines.cap(backoff(retry_state)),
+        stop=stop_any(stop_after_attempt(LLM_MAX_ATTEMPTS), lambda retry_state: deadlines.expired()),
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        reraise=True,
+    )
+
+async def create_completion(messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float, **kwargs):
+    """Create a completion (or open a stream) within the shared rate limits.
+
+    Fails fast with CircuitOpenError while the circuit breaker is open, and with
+    DeadlineExceeded once the current deadline has passed; the request timeout
+    is capped at the time left until the deadline.
+    Returns the parsed response and the number of tokens reserved for it.
+    """
+    deadlines.check()
+    breaker = circuit_breaker.get_breaker()
+    probe = breaker.before_call()
+    limiter = rate_limiter.get_limiter()
+    estimated_tokens = token_budget.count_message_tokens(messages, model) + max_tokens
+    sent = failed = False
+    try:
+        await limiter.acquire(estimated_tokens)
+        start = time.perf_counter()
+        sent = True
+        raw = await get_client().chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=deadlines.cap(LLM_TIMEOUT),
+            **kwargs,
+        )
+    except RateLimitError as e:
+        # Our own quota running out says nothing about the provider's health
+        await limiter.block(e.response.headers)
+        raise
+    except RETRYABLE_ERRORS:
+        failed = True
+        raise
+    except asyncio.CancelledError:
+        # Cancelled by a stage timeout, the deadline or a faster hedge: says nothing about upstream health
+        sent = False
+        raise
+    finally:
+        if sent:
+            breaker.record(time.perf_counter() - start, failed, probe)
+        else:
+            # Never sent (or cancelled), so there is no outcome; free the probe slot for the next call
+            breaker.release(probe)
+    await limiter.update_from_headers(raw.headers)
+    return raw.parse(), estimated_tokens
+
+async def chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float,
+                          stage: Optional[str] = None, response_format: Optional[Dict[str, str]] = None) -> str:
+    """Request a chat completion and return the message content.
+
+    Requests slower than is usual for ``stage`` may be hedged (see hedging.py).
+    ``response_format`` is passed through, e.g. {"type": "json_object"} for JSON mode.
+    """
+    hedger = hedging.get_hedger()
+    cost = token_budget.count_message_tokens(messages, model) + max_tokens
+    options = {"response_format": response_format} if response_format else {}
+    attempts = 0
+    try:
+        async for attempt in retrying():
+            attempts = attempt.retry_state.attempt_number
+            with attempt:
+                response, estimated_tokens = await hedger.run(
+                    stage,
+                    lambda: create_completion(messages, model, max_tokens, temperature, **options),
+                    tokens=cost,
+                )
+    finally:
+        # Also when every attempt failed: those calls retry the most
+        llm_metrics.record_retries(max(0, attempts - 1))
+    if response.usage:
+        await rate_limiter.get_limiter().reconcile(estimated_tokens, response.usage.total_tokens)
+        record_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+async def stream_chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float,
+                                 call: Optional[llm_metrics.LLMCall] = None) -> AsyncIterator[str]:
+    """Stream a chat completion, yielding content deltas as the model produces them.
+
+    Only opening the stream is retried; retries are counted on ``call`` (default: the current call).
+    The upstream response is closed when the caller stops iterating early (e.g. the client disconnected).
+    """
+    attempts = 0
+    try:
+        async for attempt in retrying():
+            attempts = attempt.retry_state.attempt_number
+            with attempt:
+                stream, _ = await create_completion(messages, model, max_tokens, temperature, stream=True)
+    finally:
+        if call is not None:
+            call.retries += max(0, attempts - 1)
+        else:
+            llm_metrics.record_retries(max(0, attempts - 1))
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.response.aclose()
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from prometheus_client import Counter, Histogram
+import metrics
+
+# Load environment variables
+load_dotenv()
+# Prices in dollars per million prompt and completion tokens, used to estimate the cost of each call.
+# Models are matched exactly, then by the longest price entry they start with. Override with a JSON object, e.g.
+# LLM_PRICES={"gpt-4-turbo": [10, 30], "gpt-4o-mini": [0.15, 0.6]}
+LLM_PRICES: Dict[str, list] = json.loads(os.getenv("LLM_PRICES") or "null") or {
+    "gpt-4-turbo": [10.0, 30.0],
+    "gpt-4o": [2.5, 10.0],
+    "gpt-4o-mini": [0.15, 0.6],
+    "gpt-3.5-turbo": [0.5, 1.5],
+}
+LLM_TELEMETRY_LOG = os.getenv("LLM_TELEMETRY_LOG", "false").lower() == "true"  # Print a JSON line per call
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Metrics
+LLM_CALLS = Counter("llm_calls_total", "LLM calls by result (ok, cache_hit or error)", ["stage", "model", "result"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens used by LLM calls", ["stage", "model", "type"])
+LLM_COST = Counter("llm_cost_dollars_total", "Estimated cost of LLM calls", ["stage", "model"])
+LLM_RETRIES = Counter("llm_retries_total", "Retried LLM requests", ["stage", "model"])
+LLM_CALL_SECONDS = Histogram("llm_call_seconds", "Total time of LLM calls, including queuing and retries",
+                             ["stage", "model"], buckets=LATENCY_BUCKETS)
+LLM_HEDGES = Counter("llm_hedges_total", "Duplicate requests sent for slow LLM requests", ["stage"])
+LLM_HEDGE_WINS = Counter("llm_hedge_wins_total", "Duplicate requests that answered first", ["stage"])
+LLM_HEDGE_TOKENS = Counter("llm_hedge_tokens_total", "Tokens reserved for duplicate requests", ["stage"])
+LLM_FIRST_BYTE_SECONDS = Histogram("llm_time_to_first_byte_seconds", "Time until the LLM started responding",
+                                   ["stage", "model"], buckets=LATENCY_BUCKETS)
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated cost in dollars of a call, or 0 for a model without a price."""
+    prices = LLM_PRICES.get(model)
+    if prices is None:
+        prefixes = [name for name in LLM_PRICES if model.startswith(name)]
+        prices = LLM_PRICES[max(prefixes, key=len)] if prefixes else [0, 0]
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+class LLMCall:
+    """Telemetry of one LLM call, filled in as the call proceeds.
+
+    A call that never reached the LLM (answered from the cache, or by an
+    identical request already in flight) counts as a cache hit.
+    """
+
+    def __init__(self, stage: Optional[str], model: str, prompt_tokens: int = 0):
+        self.stage = stage or "default"
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = 0
+        self.first_byte: Optional[float] = None
+        self.retries = 0
+        self.hedges = 0  # Duplicate requests sent (see hedging.py)
+        self.upstream = False
+        self.start = time.perf_counter()
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        self.upstream = True
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def mark_first_byte(self, seconds: Optional[float] = None):
+        """Record when the response started, ``seconds`` after its request was sent (default: since the call started)."""
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter() - self.start if seconds is None else seconds
+
+    def finish(self, error: bool = False):
+        """Record the completed call in the metrics and the current task's usage."""
+        seconds = time.perf_counter() - self.start
+        # Only the answer that was used reports usage; each duplicate is billed at least its prompt
+        hedge_tokens = self.hedges * self.prompt_tokens
+        cost = estimate_cost(self.model, self.prompt_tokens + hedge_tokens, self.completion_tokens)
+        result = "error" if error else "ok" if self.upstream else "cache_hit"
+        labels = {"stage": self.stage, "model": self.model}
+        LLM_CALLS.labels(result=result, **labels).inc()
+        LLM_TOKENS.labels(type="prompt", **labels).inc(self.prompt_tokens)
+        LLM_TOKENS.labels(type="completion", **labels).inc(self.completion_tokens)
+        LLM_TOKENS.labels(type="hedge_prompt", **labels).inc(hedge_tokens)
+        LLM_COST.labels(**labels).inc(cost)
+        LLM_RETRIES.labels(**labels).inc(self.retries)
+        LLM_CALL_SECONDS.labels(**labels).observe(seconds)
+        if self.first_byte is not None:
+            LLM_FIRST_BYTE_SECONDS.labels(**labels).observe(self.first_byte)
+        metrics.record_timing("llm", seconds)
+
+        usage = _task_usage.get()
+        if usage is not None:
+            for totals in (usage, usage.setdefault("stages", {}).setdefault(self.stage, {})):
+                add_to_totals(totals, result, self.prompt_tokens + hedge_tokens, self.completion_tokens,
+                              self.retries, cost, seconds)
+        if LLM_TELEMETRY_LOG:
+            print(json.dumps({
+                "event": "llm_call",
+                "task_id": _task_id.get(),
+                "stage": self.stage,
+                "model": self.model,
+                "result": result,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "time_to_first_byte": round(self.first_byte, 3) if self.first_byte is not None else None,
+                "seconds": round(seconds, 3),
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "cost": round(cost, 6),
+            }))
+
+def add_to_totals(totals: Dict[str, Any], result: str, prompt_tokens: int, completion_tokens: int,
+                  retries: int, cost: float, seconds: float):
+    totals["calls"] = totals.get("calls", 0) + 1
+    totals["cache_hits"] = totals.get("cache_hits", 0) + int(result == "cache_hit")
+    totals["errors"] = totals.get("errors", 0) + int(result == "error")
+    totals["retries"] = totals.get("retries", 0) + retries
+    totals["prompt_tokens"] = totals.get("prompt_tokens", 0) + prompt_tokens
+    totals["completion_tokens"] = totals.get("completion_tokens", 0) + completion_tokens
+    totals["cost"] = round(totals.get("cost", 0.0) + cost, 6)
+    totals["seconds"] = round(totals.get("seconds", 0.0) + seconds, 3)
+
+# The call being made in the current context, and the task whose usage it counts towards
+_current_call: ContextVar[Optional[LLMCall]] = ContextVar("llm_call", default=None)
+_task_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_task_usage", default=None)
+_task_id: ContextVar[Optional[str]] = ContextVar("llm_task_id", default=None)
+
+@contextmanager
+def track(stage: Optional[str], model: str):
+    """Record the LLM call made in the block."""
+    call = LLMCall(stage, model)
+    token = _current_call.set(call)
+    try:
+        yield call
+    except BaseException:
+        call.finish(error=True)
+        raise
+    finally:
+        _current_call.reset(token)
+    call.finish()
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    """Add the token usage of an upstream response to the current call, if any."""
+    call = _current_call.get()
+    if call is not None:
+        call.add_tokens(prompt_tokens, completion_tokens)
+
+def record_response(seconds: float):
+    """Record that an upstream request of the current call got its response after ``seconds``."""
+    call = _current_call.get()
+    if call is not None:
+        call.mark_first_byte(seconds)
+
+def record_hedge(stage: str, tokens: int):
+    """Count a duplicate request sent for a slow request of the current call; ``tokens`` is its estimated size."""
+    LLM_HEDGES.labels(stage=stage).inc()
+    LLM_HEDGE_TOKENS.labels(stage=stage).inc(tokens)
+    call = _current_call.get()
+    if call is not None:
+        call.hedges += 1
+
+def record_retries(retries: int):
+    call = _current_call.get()
+    if call is not None:
+        call.retries += retries
+
+@contextmanager
+def task_usage(task_id: str, usage: Dict[str, Any]):
+    """Add the usage of every LLM call made in the block to ``usage``, totalled and per stage."""
+    usage_token = _task_usage.set(usage)
+    id_token = _task_id.set(task_id)
+    try:
+        yield usage
+    finally:
+        _task_usage.reset(usage_token)
+        _task_id.reset(id_token)
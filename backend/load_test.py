@@ -0,0 +1,381 @@
+"""API load benchmark.
+
+Drives a realistic mix of API traffic at a fixed concurrency and reports
+throughput and p50/p95/p99 latency per endpoint, plus per-stage pipeline
+timings taken from the completed analyses. Each virtual user repeatedly picks
+a scenario by weight:
+
+- analyze:  POST /api/v2/analyze, poll the status endpoint until the task
+            finishes, then GET /api/v2/results/{id}
+- results:  GET /api/v2/results/{id} for a result created earlier in the run
+- chat:     create a chat session and send it a message
+- projects: GET /api/projects/
+
+With --spawn the harness starts its own stack from the backend directory: the
+mock LLM server (mock_llm_server.py), the API with DEV_MODE auth and an
+analysis worker, on SQLite by default or on --database-url (e.g. Postgres).
+Its SQLite files (database, job queue, rate limiter state) are created in a
+fresh temporary directory for each run, so leftovers of an earlier or aborted
+run cannot skew the numbers.
+Without it, it targets an already running API at --url, which must run with
+DEV_MODE=true.
+
+Usage (from the backend directory):
+
+    python -m load_test --spawn --concurrency 20 --duration 120 --save-baseline
+    python -m load_test --spawn --concurrency 20 --duration 120 --compare latest
+
+Baselines are JSON files in --baseline-dir named after the current git commit
+(plus "latest.json"); --compare exits with status 1 when a p95 latency or the
+throughput regressed by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import shutil
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+import httpx
+from dotenv import load_dotenv
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Load environment variables
+load_dotenv()
+LOAD_TEST_URL = os.getenv("LOAD_TEST_URL", "http://127.0.0.1:8000")
+LOAD_TEST_CONCURRENCY = int(os.getenv("LOAD_TEST_CONCURRENCY", "10"))  # Virtual users
+LOAD_TEST_DURATION = float(os.getenv("LOAD_TEST_DURATION", "60"))  # Seconds
+LOAD_TEST_MIX = os.getenv("LOAD_TEST_MIX", "analyze=1,results=3,chat=2,projects=4")  # Scenario weights
+LOAD_TEST_BASELINE_DIR = os.getenv("LOAD_TEST_BASELINE_DIR", "./benchmarks")
+LOAD_TEST_TOLERANCE = float(os.getenv("LOAD_TEST_TOLERANCE", "0.1"))  # Allowed relative regression
+POLL_INTERVAL = 1.0  # Seconds between status checks of an analysis
+ANALYSIS_TIMEOUT = 600  # Seconds to wait for an analysis to finish
+SPAWN_API_PORT = 8000
+SPAWN_MOCK_PORT = 8001
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def summarize(latencies: List[float], duration: float, errors: int = 0) -> Dict[str, Any]:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / duration if duration else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse scenario weights such as "analyze=1,results=3"."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {name.strip()}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def build_submission(number: int) -> Dict[str, Any]:
+    """A complete v2 submission; ``number`` keeps it unique so it is neither deduplicated nor cached."""
+    return {
+        "context": {
+            "product_description": f"A collaborative whiteboard for remote product teams (load test submission {number}).",
+            "target_audience": "Product managers and designers at startups with 5-50 employees.",
+            "business_goals": "Reach 10,000 weekly active teams and convert 4% of them to the paid plan within a year.",
+        },
+        "user_journey": {
+            "user_endgame": "Teams plan and review every product decision on the shared board.",
+            "beginner_stage": "A single user sketches ideas and invites one or two teammates.",
+            "intermediate_stage": "The team runs its weekly planning on the board using templates.",
+            "advanced_stage": "The organization links boards to its roadmap and issue tracker.",
+            "key_challenges": {
+                "beginner": ["Understanding the value alone", "Inviting teammates"],
+                "intermediate": ["Building a habit", "Finding the right templates"],
+                "advanced": ["Integrations", "Permissions"],
+            },
+        },
+        "deep_inputs": {
+            "desirable": {
+                "value_proposition": "Real-time collaboration with no setup.",
+                "user_needs": "Quick alignment across time zones.",
+                "competitive_differentiation": "Product-specific templates and roadmap links.",
+            },
+            "effective": {
+                "core_problems": "Scattered planning documents and long meetings.",
+                "success_metrics": "Boards created per team and weekly active editors.",
+                "friction_points": "Inviting teammates requires an admin.",
+            },
+            "efficient": {
+                "acquisition_cost": "About $12 per free team through content marketing.",
+                "conversion_strategy": "Board limits and premium integrations.",
+                "resource_allocation": "70% of engineering on the shared core, 30% on paid features.",
+            },
+            "polished": {
+                "user_experience": "Fast and clean, but some menus are crowded.",
+                "onboarding_process": "A sample board and a three-step checklist.",
+                "feedback_mechanisms": "In-app surveys and a public roadmap.",
+            },
+        },
+    }
+
+class Stats:
+    """Latencies and errors collected during a run."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.stage_timings: Dict[str, List[float]] = {}
+        self.analyses: List[float] = []  # Submit to completion, seconds
+        self.result_ids: List[int] = []
+        self.submissions = 0
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies.setdefault(endpoint, [])
+        if ok:
+            self.latencies[endpoint].append(seconds)
+        else:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, duration: float, config: Dict[str, Any]) -> Dict[str, Any]:
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "config": config,
+            "duration": duration,
+            "throughput": requests / duration if duration else 0.0,
+            "endpoints": {
+                endpoint: summarize(latencies, duration, self.errors.get(endpoint, 0))
+                for endpoint, latencies in sorted(self.latencies.items())
+            },
+            "stages": {stage: summarize(timings, duration) for stage, timings in sorted(self.stage_timings.items())},
+            "analysis": summarize(self.analyses, duration),
+        }
+
+async def request(client: httpx.AsyncClient, stats: Stats, endpoint: str, method: str, path: str, **kwargs) -> Optional[Any]:
+    """Make a timed request, recorded under the route template ``endpoint``. Returns the JSON body, or None on failure."""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        response, ok = None, False
+    stats.record(endpoint, time.perf_counter() - start, ok)
+    return response.json() if ok else None
+
+# Scenarios
+async def analyze(client: httpx.AsyncClient, stats: Stats):
+    stats.submissions += 1
+    start = time.perf_counter()
+    task = await request(client, stats, "POST /api/v2/analyze", "POST", "/api/v2/analyze",
+                         json=build_submission(stats.submissions))
+    if not task:
+        return
+    status_path = f"/api/v2/analyze/{task['task_id']}/status"
+    while time.perf_counter() - start < ANALYSIS_TIMEOUT:
+        await asyncio.sleep(POLL_INTERVAL)
+        status = await request(client, stats, "GET /api/v2/analyze/{task_id}/status", "GET", status_path)
+        if status and status["status"] != "processing":
+            break
+    else:
+        return
+    if status["status"] != "completed":
+        stats.errors["analysis"] = stats.errors.get("analysis", 0) + 1
+        return
+    stats.analyses.append(time.perf_counter() - start)
+    result = await request(client, stats, "GET /api/v2/results/{result_id}", "GET", f"/api/v2/results/{status['result_id']}")
+    if result:
+        stats.result_ids.append(result["id"])
+        for stage, seconds in (result["analysis_result"] or {}).get("stage_timings", {}).items():
+            stats.stage_timings.setdefault(stage, []).append(seconds)
+
+async def results(client: httpx.AsyncClient, stats: Stats):
+    if not stats.result_ids:
+        return await projects(client, stats)
+    result_id = random.choice(stats.result_ids)
+    await request(client, stats, "GET /api/v2/results/{result_id}", "GET", f"/api/v2/results/{result_id}")
+
+async def chat(client: httpx.AsyncClient, stats: Stats):
+    quiz_result_id = random.choice(stats.result_ids) if stats.result_ids else None
+    session = await request(client, stats, "POST /api/chat/sessions", "POST", "/api/chat/sessions",
+                            json={"quiz_result_id": quiz_result_id})
+    if session:
+        await request(client, stats, "POST /api/chat/sessions/{session_id}/messages", "POST",
+                      f"/api/chat/sessions/{session['id']}/messages",
+                      json={"user_message": "How should we decide what to keep in the free tier?"})
+
+async def projects(client: httpx.AsyncClient, stats: Stats):
+    await request(client, stats, "GET /api/projects/", "GET", "/api/projects/")
+
+SCENARIOS = {"analyze": analyze, "results": results, "chat": chat, "projects": projects}
+
+async def virtual_user(client: httpx.AsyncClient, stats: Stats, mix: Dict[str, float], until: float):
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < until:
+        scenario = random.choices(names, weights)[0]
+        await SCENARIOS[scenario](client, stats)
+
+async def run_load(url: str, concurrency: int, duration: float, mix: Dict[str, float]) -> Stats:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=ANALYSIS_TIMEOUT) as client:
+        until = time.perf_counter() + duration
+        # Analyses that are still running at the deadline are waited for, so stage timings are complete
+        await asyncio.gather(*(virtual_user(client, stats, mix, until) for _ in range(concurrency)))
+    return stats
+
+# Test stack
+def spawn_stack(database_url: str, mock_latency: Optional[str], state_dir: str) -> List[subprocess.Popen]:
+    """Start the mock LLM server, the API (DEV_MODE auth) and a worker from the backend directory.
+
+    The job queue and rate limiter state are kept in ``state_dir``, which should be empty.
+    """
+    env = dict(
+        os.environ,
+        DEV_MODE="true",
+        DATABASE_URL=database_url,
+        OPENAI_API_KEY="mock",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{SPAWN_MOCK_PORT}/v1",
+        JOB_QUEUE_PATH=os.path.join(state_dir, "job_queue.db"),
+        RATE_LIMIT_STATE_PATH=os.path.join(state_dir, "rate_limit.state"),
+        LLM_CACHE_L2="none",
+        ADMISSION_MAX_PER_USER="1000000",  # Every virtual user is the same dev user
+    )
+    mock_command = [sys.executable, "-m", "mock_llm_server", "--port", str(SPAWN_MOCK_PORT)]
+    if mock_latency:
+        mock_command += ["--latency", mock_latency]
+    commands = [
+        mock_command,
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(SPAWN_API_PORT), "--log-level", "warning"],
+        [sys.executable, "-m", "worker"],
+    ]
+    return [subprocess.Popen(command, cwd=BACKEND_DIR, env=env) for command in commands]
+
+def wait_until_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/api/questions").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"API at {url} did not start within {timeout:.0f}s")
+
+# Baselines
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_baseline(report: Dict[str, Any], baseline_dir: str) -> str:
+    os.makedirs(baseline_dir, exist_ok=True)
+    path = os.path.join(baseline_dir, f"{report['commit']}.json")
+    for target in (path, os.path.join(baseline_dir, "latest.json")):
+        with open(target, "w") as f:
+            json.dump(report, f, indent=2)
+    return path
+
+def load_baseline(name: str, baseline_dir: str) -> Dict[str, Any]:
+    path = name if name.endswith(".json") else os.path.join(baseline_dir, f"{name}.json")
+    with open(path) as f:
+        return json.load(f)
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of the report against the baseline, beyond ``tolerance`` (relative)."""
+    regressions = []
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput']:.2f} -> {report['throughput']:.2f} req/s")
+    for section in ("endpoints", "stages"):
+        for name, current in report[section].items():
+            before = baseline[section].get(name, {}).get("p95")
+            if before and current["p95"] and current["p95"] > before * (1 + tolerance):
+                regressions.append(f"{name} p95 {before * 1000:.0f} -> {current['p95'] * 1000:.0f} ms")
+    before, current = baseline["analysis"]["p95"], report["analysis"]["p95"]
+    if before and current and current > before * (1 + tolerance):
+        regressions.append(f"analysis p95 {before:.1f} -> {current:.1f} s")
+    return regressions
+
+def print_report(report: Dict[str, Any]):
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+
+    print(f"\nCommit {report['commit']}: {report['throughput']:.2f} req/s over {report['duration']:.0f}s")
+    print(f"\n{'Endpoint':<50} {'count':>7} {'errors':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:<50} {row['count']:>7} {row['errors']:>7} {row['throughput']:>7.2f} "
+              f"{ms(row['p50']):>8} {ms(row['p95']):>8} {ms(row['p99']):>8}")
+    if report["stages"]:
+        print(f"\n{'Pipeline stage':<50} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, row in report["stages"].items():
+            print(f"{name:<50} {row['count']:>7} {ms(row['p50']):>8} {ms(row['p95']):>8} {ms(row['p99']):>8}")
+    analysis = report["analysis"]
+    if analysis["count"]:
+        print(f"\nAnalyses completed: {analysis['count']} "
+              f"(p50 {analysis['p50']:.1f}s, p95 {analysis['p95']:.1f}s, p99 {analysis['p99']:.1f}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API under a realistic traffic mix")
+    parser.add_argument("--url", default=LOAD_TEST_URL, help="API to benchmark (ignored with --spawn)")
+    parser.add_argument("--concurrency", type=int, default=LOAD_TEST_CONCURRENCY, help="Virtual users")
+    parser.add_argument("--duration", type=float, default=LOAD_TEST_DURATION, help="Seconds to start new scenarios for")
+    parser.add_argument("--mix", default=LOAD_TEST_MIX, help="Scenario weights, e.g. analyze=1,results=3,chat=2,projects=4")
+    parser.add_argument("--spawn", action="store_true", help="Start the mock LLM server, API and worker")
+    parser.add_argument("--database-url", help="Database for the spawned stack (default: a new SQLite file)")
+    parser.add_argument("--mock-latency", help="Latency spec for the spawned mock LLM server")
+    parser.add_argument("--baseline-dir", default=LOAD_TEST_BASELINE_DIR)
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baseline of this commit")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline to compare with: a commit, \"latest\" or a path")
+    parser.add_argument("--tolerance", type=float, default=LOAD_TEST_TOLERANCE, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    url = f"http://127.0.0.1:{SPAWN_API_PORT}" if args.spawn else args.url
+    # A fresh directory per run, so jobs and results of earlier runs are not picked up
+    state_dir = tempfile.mkdtemp(prefix="load_test_") if args.spawn else None
+    database_url = args.database_url or (f"sqlite:///{os.path.join(state_dir, 'load_test.db')}" if state_dir else None)
+    processes = spawn_stack(database_url, args.mock_latency, state_dir) if args.spawn else []
+    try:
+        wait_until_ready(url)
+        start = time.perf_counter()
+        stats = asyncio.run(run_load(url, args.concurrency, args.duration, mix))
+        duration = time.perf_counter() - start
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        if state_dir:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+    report = stats.report(duration, {
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "mix": mix,
+        "database": database_url.split(":")[0] if args.spawn else None,
+    })
+    report["commit"] = git_commit()
+    print_report(report)
+
+    # Compare before saving, so "--compare latest --save-baseline" compares with the previous run
+    regressions = compare(report, load_baseline(args.compare, args.baseline_dir), args.tolerance) if args.compare else []
+    if args.save_baseline:
+        print(f"\nBaseline saved to {save_baseline(report, args.baseline_dir)}")
+    if regressions:
+        print("\nRegressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    if args.compare:
+        print("\nNo regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
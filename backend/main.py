@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends, Request, status, Body, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Request, status, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
@@ -10,22 +10,37 @@ from dotenv import load_dotenv
 import crud
 import models
 import schemas
-from database import engine, get_db
+from database import engine, get_db, SessionLocal
 from jose import jwt
 from analysis import analyze_quiz_results
 import ai_analysis
+import llm_client
+import llm_cache
+import job_queue
+import tasks
+import admission
+import metrics
+from circuit_breaker import CircuitOpenError
 import requests
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.routing import Match
 from pydantic import BaseModel
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from redis import Redis
+from prometheus_client import CONTENT_TYPE_LATEST
 import uuid
+import math
+import time
+import asyncio
 from datetime import datetime, timedelta
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
+# Count SQL execution time in the Server-Timing header
+metrics.instrument_engine(engine)
+
 # Load environment variables
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -33,12 +48,14 @@ AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN")
 AUTH0_API_AUDIENCE = os.getenv("AUTH0_API_AUDIENCE")
 DEV_MODE = os.getenv("DEV_MODE", "false").lower() == "true"
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "0.5"))  # Seconds between checks for new stage results
+SSE_KEEPALIVE_INTERVAL = 15  # Seconds between keep-alive comments on idle streams
 
 # Import Auth0 utilities only if not in dev mode
 if not DEV_MODE:
     from .auth import VerifyToken
 
-app = FastAPI(title="Intentional Model Analyzer API")
+app = FastAPI(title="Intentional Model Analyzer API", default_response_class=metrics.TimedJSONResponse)
 
 # Security scheme for Auth0
 security = HTTPBearer(auto_error=not DEV_MODE)
@@ -52,11 +69,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize cache
+# Initialize cache and the gauges read when /metrics is scraped
 @app.on_event("startup")
 async def startup():
     redis = Redis.from_url(REDIS_URL)
     FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    metrics.register_state(metrics.StateCollector(
+        engine,
+        queue_counts=lambda: job_queue.get_queue().counts(tasks.ANALYSIS_QUEUE),
+        hit_ratios={
+            "llm": lambda: llm_cache.get_cache().stats()["hit_ratio"],
+            "llm_l1": lambda: llm_cache.get_cache().stats()["l1_hit_ratio"],
+            "llm_l2": lambda: llm_cache.get_cache().stats()["l2_hit_ratio"],
+        },
+    ))
+
+# Release the pooled LLM connections
+@app.on_event("shutdown")
+async def shutdown():
+    await llm_client.close_client()
+
+def route_template(scope) -> str:
+    """Path template of the route a request matches, e.g. /api/v2/results/{result_id}."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+# Request latency and in-flight metrics, and a Server-Timing header splitting
+# each response into auth, DB, LLM and serialization time
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    route = route_template(request.scope)
+    timings = metrics.start_timings()
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        timings["total"] = time.perf_counter() - start
+        metrics.REQUEST_SECONDS.labels(method=request.method, route=route, status=status_code).observe(timings["total"])
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Operational metrics in the Prometheus text format"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+# The LLM is unavailable: tell clients when to come back instead of failing with a 500
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The AI service is temporarily unavailable. Please try again later."},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
 
 # Auth0 token validation
 async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
@@ -67,7 +139,8 @@ async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] =
     
     # In production, validate the JWT token
     token = credentials.credentials
-    result = VerifyToken(token).verify()
+    with metrics.timed("auth"):
+        result = VerifyToken(token).verify()
     
     if result.get("status"):
         raise HTTPException(
@@ -78,6 +151,11 @@ async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] =
     
     return result
 
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """Format a single Server-Sent Events message"""
+    message = f"id: {event_id}\n" if event_id is not None else ""
+    return message + f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # User management routes
 @app.post("/api/users/", response_model=schemas.User)
 async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -218,30 +296,81 @@ async def submit_quiz(
 @app.post("/api/v2/analyze", response_model=Dict[str, Any])
 async def analyze_strategy(
     submission: schemas.QuizSubmission, 
-    background_tasks: BackgroundTasks,
+    base_result_id: Optional[int] = None,
     current_user = Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
     """
     Submit a comprehensive free-model strategy for analysis using the DEEP framework.
     This endpoint processes detailed free-form text inputs and returns AI-powered analysis.
+    
+    Pass ``base_result_id`` when re-submitting an edited version of an earlier result: only
+    the stages affected by the edits are re-run and the result is saved as its next version.
     """
+    base_result = None
+    if base_result_id is not None:
+        base_result = crud.get_quiz_result(db, quiz_result_id=base_result_id)
+        if not base_result:
+            raise HTTPException(status_code=404, detail="Base result not found")
+        if base_result.user_id != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Not authorized to access this result")
+    
+    # An identical submission that is still in flight (e.g. a double-clicked submit)
+    # joins the existing task instead of paying for a second analysis
+    input_hash = ai_analysis.submission_key(submission.dict(), base_result_id)
+    active_task = crud.get_active_task_by_input_hash(db, user_id=current_user["id"], input_hash=input_hash)
+    if active_task:
+        return {
+            "task_id": active_task.task_id,
+            "status": "processing",
+            "result_id": active_task.result_id,
+            "message": "An identical analysis is already being processed. Please poll the status endpoint to check for completion."
+        }
+    
+    # Shed load before queueing more work than the workers can handle
+    try:
+        admission.check_admission(db, user_id=current_user["id"])
+    except admission.AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     # Generate a task ID for the background analysis
     task_id = str(uuid.uuid4())
     
-    # Start the analysis in the background
-    background_tasks.add_task(
-        process_analysis_task, 
-        task_id=task_id, 
-        submission=submission, 
-        user_id=current_user["id"], 
-        db=db
+    # Score the submission with the rule-based analyzer right away; the AI
+    # analysis replaces this provisional result when it completes
+    preview = tasks.save_preview(db, submission=submission, user_id=current_user["id"], base_result=base_result)
+    
+    # Record the task so its status can be polled
+    crud.create_analysis_task(
+        db,
+        task_id=task_id,
+        user_id=current_user["id"],
+        input_hash=input_hash,
+        result_id=preview.id
+    )
+    
+    # Queue the analysis for the worker processes (see worker.py)
+    job_queue.get_queue().enqueue(
+        tasks.ANALYSIS_QUEUE,
+        tasks.build_analysis_job(
+            task_id=task_id,
+            submission=submission,
+            user_id=current_user["id"],
+            base_result_id=base_result_id
+        ),
+        job_id=task_id
     )
     
     # Return the task ID for the client to poll
     return {
         "task_id": task_id,
         "status": "processing",
+        "result_id": preview.id,
+        "preview": preview.analysis_result,
         "message": "Your analysis is being processed. Please poll the status endpoint to check for completion."
     }
 
@@ -252,28 +381,107 @@ async def check_analysis_status(
     current_user = Depends(get_current_user)
 ):
     """Check the status of an analysis task"""
-    # TODO: Implement checking of task status from a Redis or database store
-    # For now, return a dummy "completed" status
-    # In production, this would check a task queue or database
-    
-    # Check for the result in the database
-    result = crud.get_quiz_result_by_task_id(db, task_id=task_id)
-    if result:
-        # If completed, return the result ID
+    task = crud.get_analysis_task(db, task_id=task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Analysis task not found")
+    
+    if task.user_id != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Not authorized to access this analysis task")
+    
+    if task.status == "completed":
         return {
             "task_id": task_id,
             "status": "completed",
             "message": "Analysis complete",
-            "result_id": result.id
+            "result_id": task.result_id,
+            "llm_usage": task.llm_usage
+        }
+    
+    # Stages checkpointed so far
+    progress = {
+        "completed_stages": crud.get_completed_stages(db, task_id=task_id),
+        "total_stages": len(ai_analysis.PUBLISHED_STAGES)
+    }
+    
+    if task.status == "failed":
+        return {
+            "task_id": task_id,
+            "status": "failed",
+            "message": "Analysis failed",
+            "error": task.error,
+            "result_id": task.result_id,
+            "progress": progress,
+            "llm_usage": task.llm_usage
         }
     
-    # Otherwise, assume it's still processing
+    # Pending or processing
     return {
         "task_id": task_id,
         "status": "processing",
+        "stage": task.stage,
+        "progress": progress,
         "message": "Your analysis is still being processed. Please check back in a few moments."
     }
 
+@app.get("/api/v2/analyze/{task_id}/events")
+async def stream_analysis_events(
+    task_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Stream the results of an analysis task as Server-Sent Events.
+    Each pipeline stage (DEEP dimensions, score, key findings, model recommendation,
+    implementation plan, recommendations) is sent as soon as it completes, followed
+    by a final "completed" or "failed" event. Reconnecting clients can resume by
+    sending the standard Last-Event-ID header.
+    """
+    task = crud.get_analysis_task(db, task_id=task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Analysis task not found")
+    
+    if task.user_id != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Not authorized to access this analysis task")
+    
+    try:
+        last_event_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_event_id = 0  # Not an ID we sent: replay every stage
+    
+    async def events():
+        nonlocal last_event_id
+        idle = 0.0
+        while not await request.is_disconnected():
+            # Use a short-lived session per check so a long stream doesn't pin a pooled connection.
+            # Read the task status before the stage results so nothing is missed when it finishes.
+            with SessionLocal() as poll_db:
+                current_task = crud.get_analysis_task(poll_db, task_id=task_id)
+                stage_results = crud.get_stage_results(poll_db, task_id=task_id, after_id=last_event_id)
+            
+            for stage_result in stage_results:
+                last_event_id = stage_result.id
+                yield format_sse(stage_result.stage, stage_result.output, event_id=stage_result.id)
+            
+            if current_task.status == "completed":
+                yield format_sse("completed", {"task_id": task_id, "result_id": current_task.result_id})
+                return
+            if current_task.status == "failed":
+                yield format_sse("failed", {"task_id": task_id, "error": current_task.error})
+                return
+            
+            idle = 0.0 if stage_results else idle + SSE_POLL_INTERVAL
+            if idle >= SSE_KEEPALIVE_INTERVAL:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/v2/results/{result_id}", response_model=schemas.QuizResult)
 async def get_analysis_result(
     result_id: int,
@@ -292,6 +500,29 @@ async def get_analysis_result(
     return result
 
 # Chat routes
+def build_chat_context(db: Session, session: models.ChatSession, message: schemas.ChatMessageCreate) -> Dict[str, Any]:
+    """Build the context for the AI assistant from the session's quiz result and the message"""
+    context = {}
+    
+    # If the session is linked to a quiz result, include that in the context
+    if session.quiz_result_id:
+        quiz_result = crud.get_quiz_result(db, quiz_result_id=session.quiz_result_id)
+        if quiz_result:
+            context["quiz_result"] = {
+                "product_description": quiz_result.product_description,
+                "target_audience": quiz_result.target_audience,
+                "business_goals": quiz_result.business_goals,
+                "recommended_model": quiz_result.recommended_model,
+                "overall_score": quiz_result.overall_score,
+                "analysis_result": quiz_result.analysis_result
+            }
+    
+    # Add any additional context provided with the message
+    if message.context:
+        context.update(message.context)
+    
+    return context
+
 @app.post("/api/chat/sessions", response_model=schemas.ChatSession)
 async def create_chat_session(
     session_data: schemas.ChatSessionCreate, 
@@ -348,24 +579,7 @@ async def send_message(
         raise HTTPException(status_code=403, detail="Not authorized to access this chat session")
     
     # Build context for the AI assistant
-    context = {}
-    
-    # If the session is linked to a quiz result, include that in the context
-    if session.quiz_result_id:
-        quiz_result = crud.get_quiz_result(db, quiz_result_id=session.quiz_result_id)
-        if quiz_result:
-            context["quiz_result"] = {
-                "product_description": quiz_result.product_description,
-                "target_audience": quiz_result.target_audience,
-                "business_goals": quiz_result.business_goals,
-                "recommended_model": quiz_result.recommended_model,
-                "overall_score": quiz_result.overall_score,
-                "analysis_result": quiz_result.analysis_result
-            }
-    
-    # Add any additional context provided with the message
-    if message.context:
-        context.update(message.context)
+    context = build_chat_context(db, session, message)
     
     # Process the message with the AI assistant
     assistant_response = await ai_analysis.analyze_chat_message(
@@ -388,61 +602,66 @@ async def send_message(
         created_at=db_message.created_at
     )
 
-# Background task for analysis
-async def process_analysis_task(task_id: str, submission: schemas.QuizSubmission, user_id: str, db: Session):
-    """Process the analysis in the background and save the result"""
-    try:
-        # Perform the analysis
-        result = await ai_analysis.analyze_quiz_submission(submission.dict())
-        
-        # Create the quiz result
-        quiz_result = schemas.QuizResultCreate(
-            # Context information
-            product_description=submission.context.product_description,
-            target_audience=submission.context.target_audience,
-            business_goals=submission.context.business_goals,
-            
-            # User journey information
-            user_endgame=submission.user_journey.user_endgame,
-            beginner_stage=submission.user_journey.beginner_stage,
-            intermediate_stage=submission.user_journey.intermediate_stage,
-            advanced_stage=submission.user_journey.advanced_stage,
-            key_challenges=submission.user_journey.key_challenges,
-            
-            # Current model assessment
-            current_model=submission.current_model.current_model if submission.current_model else None,
-            current_metrics=submission.current_model.current_metrics if submission.current_model else None,
-            
-            # DEEP framework inputs
-            quiz_answers=[a.dict() for a in submission.structured_answers] if submission.structured_answers else [],
-            desirable_inputs=submission.deep_inputs.desirable.dict(),
-            effective_inputs=submission.deep_inputs.effective.dict(),
-            efficient_inputs=submission.deep_inputs.efficient.dict(),
-            polished_inputs=submission.deep_inputs.polished.dict(),
-            
-            # Analysis results
-            analysis_result=result,
-            recommendations=result["recommendations"],
-            implementation_plan=result["implementation_plan"],
-            
-            # Scores
-            overall_score=result["score"],
-            desirable_score=result["desirable"]["score"],
-            effective_score=result["effective"]["score"],
-            efficient_score=result["efficient"]["score"],
-            polished_score=result["polished"]["score"],
-            
-            # Recommendations
-            recommended_model=result["recommended_model"]
-        )
-        
-        # Save the result with the task ID
-        crud.create_quiz_result_with_task_id(db=db, quiz_result=quiz_result, user_id=user_id, task_id=task_id)
+@app.post("/api/chat/sessions/{session_id}/messages/stream")
+async def stream_message(
+    session_id: int,
+    message: schemas.ChatMessageCreate,
+    current_user = Depends(get_current_user), 
+    db: Session = Depends(get_db)
+):
+    """
+    Send a message in a chat session and stream the response as Server-Sent Events.
+    Sends a "token" event for each piece of the response as it is generated, then a
+    "done" event with the saved message once it is complete (or an "error" event).
+    """
+    # Check if the session exists and belongs to the user
+    session = crud.get_chat_session(db, session_id=session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    
+    if session.user_id != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Not authorized to access this chat session")
+    
+    context = build_chat_context(db, session, message)
+    # Release the connection rather than holding it for the length of the stream
+    db.close()
+    
+    async def events():
+        parts = []
+        upstream = ai_analysis.stream_chat_message(message=message.user_message, context=context)
+        try:
+            async for delta in upstream:
+                parts.append(delta)
+                yield format_sse("token", {"content": delta})
+        except Exception as e:
+            print(f"Error streaming chat response: {str(e)}")
+            yield format_sse("error", {"detail": "Failed to generate a response"})
+            return
+        finally:
+            # Runs on client disconnect too (the stream is cancelled), closing the upstream request
+            await upstream.aclose()
         
-    except Exception as e:
-        # In a production system, log the error and possibly notify the user
-        print(f"Error processing analysis: {str(e)}")
-        # Could also store the error in a database or queue for later retry
+        # Save the message and the assembled response once the stream is complete
+        with SessionLocal() as stream_db:
+            db_message = crud.create_chat_message(
+                db=stream_db,
+                session_id=session_id,
+                user_message=message.user_message,
+                assistant_message="".join(parts),
+                context=message.context
+            )
+            response = schemas.ChatMessageResponse(
+                user_message=db_message.user_message,
+                assistant_message=db_message.assistant_message,
+                created_at=db_message.created_at
+            )
+        yield format_sse("done", json.loads(response.json()))
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # The main application entry point
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+from dotenv import load_dotenv
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from fastapi.responses import JSONResponse
+
+# Load environment variables
+load_dotenv()
+# Set to a writable directory to aggregate metrics across processes (API workers and analysis workers)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Metrics
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time until the response started, per route template",
+                            ["method", "route", "status"],
+                            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled", multiprocess_mode="livesum")
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result (tier hit or miss)", ["cache", "result"])
+
+def get_registry() -> CollectorRegistry:
+    """Registry to expose: every process's metrics in multiprocess mode, else this process's."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+class StateCollector:
+    """Gauges read when metrics are collected: DB pool, job queue depth and the cache hit ratios of this process."""
+
+    def __init__(self, engine, queue_counts: Callable[[], Dict[str, int]], hit_ratios: Dict[str, Callable[[], float]]):
+        self.engine = engine
+        self.queue_counts = queue_counts
+        self.hit_ratios = hit_ratios
+
+    def collect(self):
+        pool = self.engine.pool
+        db_pool = GaugeMetricFamily("db_pool_connections", "Connections of the DB pool by state", labels=["state"])
+        for state in ("size", "checkedout", "checkedin", "overflow"):
+            # Not every pool class (e.g. NullPool) keeps these counts
+            if hasattr(pool, state):
+                db_pool.add_metric([state], getattr(pool, state)())
+        yield db_pool
+
+        queue = GaugeMetricFamily("job_queue_depth", "Analysis jobs waiting or being worked on", labels=["state"])
+        for state, count in self.queue_counts().items():
+            queue.add_metric([state], count)
+        yield queue
+
+        ratios = GaugeMetricFamily("cache_hit_ratio", "Hit ratio of the caches of this process", labels=["cache"])
+        for cache, hit_ratio in self.hit_ratios.items():
+            ratios.add_metric([cache], hit_ratio())
+        yield ratios
+
+_state_registry = CollectorRegistry()
+
+def register_state(collector: StateCollector):
+    _state_registry.register(collector)
+
+def render() -> bytes:
+    """All metrics in the Prometheus text format."""
+    return generate_latest(get_registry()) + generate_latest(_state_registry)
+
+# Server timing: time spent in each part of handling the current request, in seconds
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timings", default=None)
+
+def start_timings() -> Dict[str, float]:
+    """Start collecting server timings for the current request."""
+    timings = {"auth": 0.0, "db": 0.0, "llm": 0.0, "serialization": 0.0}
+    _timings.set(timings)
+    return timings
+
+def record_timing(name: str, seconds: float):
+    """Add ``seconds`` to the ``name`` timing of the current request, if any."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Format timings as a Server-Timing header value (durations in milliseconds)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+class TimedJSONResponse(JSONResponse):
+    """JSON response that counts the time spent rendering it as "serialization" time."""
+
+    def render(self, content) -> bytes:
+        with timed("serialization"):
+            return super().render(content)
+
+def instrument_engine(engine):
+    """Count the time spent executing SQL statements as "db" time."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_timing("db", time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
@@ -0,0 +1,284 @@
+"""Mock LLM server.
+
+A local stand-in for the OpenAI chat completions API, for load tests and
+offline development. It answers every analysis stage (see
+ai_analysis.SYSTEM_PROMPTS) with canned, schema-valid responses and chat with
+plain text, streamed or not, after a latency drawn from a configurable
+distribution. Server errors and 429s can be injected at a given rate.
+
+Usage (from the backend directory):
+
+    python -m mock_llm_server --port 8001 --latency lognormal:1.5:0.5 --error-rate 0.01
+
+and point the API and workers at it with OPENAI_BASE_URL=http://localhost:8001/v1.
+
+Latencies are "fixed:<seconds>", "uniform:<min>:<max>", "lognormal:<median>:<sigma>"
+or "exponential:<mean>", or a JSON object mapping stage names (dimension,
+key_findings, model_recommendation, implementation_plan, recommendations,
+synthesis, chat) to such specs, with "default" for the rest. Non-streaming
+responses arrive after the drawn latency; streams send their first token after
+it and the rest at --tokens-per-second.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+from typing import Any, Callable, Dict, List
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Make the backend modules importable when started as `python -m backend.mock_llm_server`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analysis import SYSTEM_PROMPTS
+
+# Load environment variables
+load_dotenv()
+MOCK_LLM_PORT = int(os.getenv("MOCK_LLM_PORT", "8001"))
+MOCK_LLM_LATENCY = os.getenv("MOCK_LLM_LATENCY", "lognormal:1.0:0.5")
+MOCK_LLM_TOKENS_PER_SECOND = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "80"))
+MOCK_LLM_ERROR_RATE = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))  # Share of requests answered with a 500
+MOCK_LLM_RATE_LIMIT_RATE = float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0"))  # Share answered with a 429
+MOCK_LLM_SEED = os.getenv("MOCK_LLM_SEED")
+
+DIMENSIONS = {
+    "desirable_analysis": "desirable",
+    "effective_analysis": "effective",
+    "efficient_analysis": "efficient",
+    "polished_analysis": "polished",
+}
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Build a latency sampler from a spec such as "lognormal:1.5:0.5"."""
+    kind, *params = spec.split(":")
+    values = [float(param) for param in params]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class MockConfig:
+    """Latency and fault injection settings of the mock server."""
+
+    def __init__(self, latency: str = MOCK_LLM_LATENCY, tokens_per_second: float = MOCK_LLM_TOKENS_PER_SECOND,
+                 error_rate: float = MOCK_LLM_ERROR_RATE, rate_limit_rate: float = MOCK_LLM_RATE_LIMIT_RATE,
+                 seed=MOCK_LLM_SEED):
+        specs = json.loads(latency) if latency.strip().startswith("{") else {"default": latency}
+        self.latency = {stage: parse_latency(spec) for stage, spec in specs.items()}
+        self.latency.setdefault("default", parse_latency("fixed:0"))
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(int(seed) if seed is not None else None)
+
+    def sample_latency(self, stage: str) -> float:
+        return max(0.0, self.latency.get(stage, self.latency["default"])(self.rng))
+
+config = MockConfig()
+stats: Dict[str, Any] = {"requests": 0, "errors": 0, "rate_limited": 0, "stages": {}}
+
+def detect_stage(messages: List[Dict[str, str]]) -> str:
+    """Work out which analysis stage a request belongs to from its prompts."""
+    system = next((message["content"] for message in messages if message["role"] == "system"), "")
+    user = messages[1]["content"] if len(messages) > 1 else ""
+    prompt = next((name for name, text in SYSTEM_PROMPTS.items() if text == system), None)
+    if prompt in DIMENSIONS:
+        return "dimension"
+    if prompt == "implementation_plan":
+        return "implementation_plan"
+    if prompt == "analysis":
+        if "complete synthesis" in user:
+            return "synthesis"
+        if "key findings" in user:
+            return "key_findings"
+        if "free model type" in user:
+            return "model_recommendation"
+        return "recommendations"
+    return "chat"
+
+# Canned responses
+def dimension_response(dimension: str, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "score": round(rng.uniform(3, 9), 1),
+        "analysis": f"The {dimension} dimension of this free model is reasonably well developed, with clear room to improve.",
+        "strengths": [f"Clear {dimension} value for new users", "Low barrier to entry"],
+        "weaknesses": ["Limited guidance after sign-up", "Upgrade path is not obvious"],
+        "opportunities": ["Add in-product upgrade prompts", "Track activation milestones"],
+    }
+
+def implementation_plan_response() -> Dict[str, Any]:
+    step = {
+        "title": "Instrument activation",
+        "description": "Track the key actions that lead free users to value.",
+        "priority": "High",
+        "estimated_effort": "Medium",
+        "expected_impact": "High",
+        "metrics": ["Activation rate", "Time to value"],
+    }
+    return {
+        "phases": {"Phase 1": [step, dict(step, title="Simplify onboarding")], "Phase 2": [dict(step, title="Add upgrade triggers")]},
+        "timeline": "Phase 1 in the first month, phase 2 in the following quarter.",
+        "success_metrics": ["Free-to-paid conversion", "30-day retention"],
+    }
+
+KEY_FINDINGS = [
+    "Users reach value quickly but the upgrade path is unclear.",
+    "The free tier covers the core use case well.",
+    "Success metrics are not tracked consistently.",
+    "Onboarding could better highlight premium features.",
+    "Conversion triggers are missing at usage limits.",
+]
+MODEL_RECOMMENDATION = {"model_type": "Freemium", "explanation": "A permanent free tier fits the product's fast time to value."}
+RECOMMENDATIONS = """## Strategic direction
+- Keep a generous free tier focused on the core workflow.
+
+## Improvements
+- **Desirable:** highlight the unique value in onboarding.
+- **Effective:** remove friction from the first session.
+
+## Success metrics
+- Activation rate, free-to-paid conversion and retention.
+"""
+
+def build_content(stage: str, messages: List[Dict[str, str]], rng: random.Random) -> str:
+    if stage == "dimension":
+        system = messages[0]["content"]
+        dimension = next(name for prompt, name in DIMENSIONS.items() if SYSTEM_PROMPTS[prompt] == system)
+        return json.dumps(dimension_response(dimension, rng))
+    if stage == "key_findings":
+        return json.dumps({"key_findings": KEY_FINDINGS})
+    if stage == "model_recommendation":
+        return json.dumps(MODEL_RECOMMENDATION)
+    if stage == "implementation_plan":
+        return json.dumps(implementation_plan_response())
+    if stage == "synthesis":
+        return json.dumps({
+            "key_findings": KEY_FINDINGS,
+            "model_recommendation": MODEL_RECOMMENDATION,
+            "implementation_plan": implementation_plan_response(),
+            "recommendations": RECOMMENDATIONS,
+        })
+    if stage == "recommendations":
+        return RECOMMENDATIONS
+    return "Focus on shortening time to value for new users, then add upgrade prompts where free users hit limits."
+
+def count_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+def error_response(status_code: int, message: str, error_type: str, headers: Dict[str, str] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": None}},
+        headers=headers,
+    )
+
+app = FastAPI(title="Mock LLM server")
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+@app.get("/stats")
+async def get_stats():
+    """Requests served per stage and faults injected so far."""
+    return stats
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "mock")
+    stage = detect_stage(messages)
+    stats["requests"] += 1
+    stats["stages"][stage] = stats["stages"].get(stage, 0) + 1
+
+    latency = config.sample_latency(stage)
+    roll = config.rng.random()
+    if roll < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return error_response(429, "Rate limit reached (injected)", "rate_limit_exceeded", {
+            "retry-after": "1",
+            "x-ratelimit-reset-requests": "1s",
+        })
+    if roll < config.rate_limit_rate + config.error_rate:
+        stats["errors"] += 1
+        await asyncio.sleep(latency)
+        return error_response(500, "Internal server error (injected)", "server_error")
+
+    # Same prompt, same content: only latency and faults are random
+    seed = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+    content = build_content(stage, messages, random.Random(seed))
+    prompt_tokens = sum(count_tokens(message.get("content", "")) for message in messages)
+    completion_tokens = count_tokens(content)
+    completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(latency)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    async def stream():
+        def chunk(delta: Dict[str, str], finish_reason=None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        await asyncio.sleep(latency)
+        yield chunk({"role": "assistant", "content": ""})
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            yield chunk({"content": word if index == len(words) - 1 else word + " "})
+            await asyncio.sleep(count_tokens(word) / config.tokens_per_second)
+        yield chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+def main():
+    global config
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=MOCK_LLM_PORT)
+    parser.add_argument("--latency", default=MOCK_LLM_LATENCY, help="Latency distribution, or JSON of one per stage")
+    parser.add_argument("--tokens-per-second", type=float, default=MOCK_LLM_TOKENS_PER_SECOND, help="Streaming speed")
+    parser.add_argument("--error-rate", type=float, default=MOCK_LLM_ERROR_RATE, help="Share of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=MOCK_LLM_RATE_LIMIT_RATE, help="Share of requests failing with a 429")
+    parser.add_argument("--seed", type=int, default=MOCK_LLM_SEED, help="Seed for latencies and injected faults")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.tokens_per_second, args.error_rate, args.rate_limit_rate, args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
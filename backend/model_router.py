@@ -0,0 +1,84 @@
+import os
+import json
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+from prometheus_client import Counter, Histogram
+
+# Load environment variables
+load_dotenv()
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")  # Used by every stage without a matching route
+FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+
+# Routes are tried in order; the first one whose stages include the call's stage and whose
+# max_prompt_tokens (if set) covers the prompt picks the model. Override with a JSON list, e.g.
+# MODEL_ROUTES=[{"stages": ["dimension"], "model": "gpt-4o-mini", "max_prompt_tokens": 4000}]
+MODEL_ROUTES: List[Dict[str, Any]] = json.loads(os.getenv("MODEL_ROUTES") or "null") or [
+    {"stages": ["dimension"], "model": FAST_MODEL, "max_prompt_tokens": 4000},  # Short free-text fields
+    {"stages": ["chat"], "model": FAST_MODEL, "max_prompt_tokens": 4000},  # Short chat turns (context included)
+]
+LATENCY_SAMPLES = 200  # Recent latencies kept per route
+
+# Metrics, so routes can be compared across processes (valid ratio = valid / checked)
+ROUTE_CALLS = Counter("model_route_calls_total", "Routed LLM calls", ["stage", "model"])
+ROUTE_ERRORS = Counter("model_route_errors_total", "Routed LLM calls that failed", ["stage", "model"])
+ROUTE_CHECKED = Counter("model_route_outputs_checked_total", "Outputs of routed calls that were validated",
+                        ["stage", "model"])
+ROUTE_VALID = Counter("model_route_outputs_valid_total", "Outputs of routed calls that passed validation",
+                      ["stage", "model"])
+ROUTE_SECONDS = Histogram("model_route_latency_seconds", "Latency of successful routed calls", ["stage", "model"],
+                          buckets=(0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120))
+
+def route(stage: Optional[str], prompt_tokens: int) -> str:
+    """Pick the model for a call of ``stage`` with a prompt of ``prompt_tokens`` tokens."""
+    for candidate in MODEL_ROUTES:
+        if stage not in candidate.get("stages", []):
+            continue
+        max_prompt_tokens = candidate.get("max_prompt_tokens")
+        if max_prompt_tokens is None or prompt_tokens <= max_prompt_tokens:
+            return candidate["model"]
+    return DEFAULT_MODEL
+
+class RouteStats:
+    """Latency and output quality of the calls made on one route (stage + model)."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.checked = 0  # Calls whose output was checked, e.g. for valid JSON
+        self.valid = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "valid_ratio": self.valid / self.checked if self.checked else None,
+            "p50_latency": ordered[len(ordered) // 2] if ordered else None,
+            "p95_latency": ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)] if ordered else None,
+        }
+
+_routes: Dict[str, RouteStats] = {}
+
+def record(stage: Optional[str], model: str, latency: float, ok: bool = True, valid: Optional[bool] = None):
+    """Record the outcome of a routed call; ``valid`` says whether its output passed validation, if checked."""
+    labels = {"stage": stage or "default", "model": model}
+    route_stats = _routes.setdefault(f"{labels['stage']}:{model}", RouteStats())
+    route_stats.calls += 1
+    ROUTE_CALLS.labels(**labels).inc()
+    if not ok:
+        route_stats.errors += 1
+        ROUTE_ERRORS.labels(**labels).inc()
+        return
+    route_stats.latencies.append(latency)
+    ROUTE_SECONDS.labels(**labels).observe(latency)
+    if valid is not None:
+        route_stats.checked += 1
+        route_stats.valid += int(valid)
+        ROUTE_CHECKED.labels(**labels).inc()
+        ROUTE_VALID.labels(**labels).inc(int(valid))
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Latency and quality summary per route, keyed "stage:model"."""
+    return {name: route_stats.summary() for name, route_stats in _routes.items()}
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, JSON, DateTime, Text, Table
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, JSON, DateTime, Text, Table, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -86,10 +86,42 @@ class QuizResult(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     version = Column(Integer, default=1)  # For tracking versions of analysis
+    is_provisional = Column(Boolean, default=False)  # Rule-based preview, replaced by the AI analysis when it completes
 
     # Relationships
     user = relationship("User", back_populates="quiz_results")
     project = relationship("Project", back_populates="quiz_results")
+
+class AnalysisTask(Base):
+    __tablename__ = "analysis_tasks"
+
+    task_id = Column(String, primary_key=True)  # Task ID handed to the client for polling
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    status = Column(String, default="pending")  # pending, processing, completed or failed
+    stage = Column(String, nullable=True)  # Pipeline stage currently running
+    error = Column(Text, nullable=True)  # Error message if the analysis failed
+    input_hash = Column(String, index=True)  # Canonical hash of the submission, for coalescing duplicates
+    result_id = Column(Integer, ForeignKey("quiz_results.id"), nullable=True)  # Set once completed
+    llm_usage = Column(JSON, nullable=True)  # Calls, tokens, cost and time of the task's LLM calls, in total and per stage
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    # Relationships
+    result = relationship("QuizResult")
+    stage_results = relationship("AnalysisStageResult", back_populates="task", cascade="all, delete-orphan")
+
+class AnalysisStageResult(Base):
+    __tablename__ = "analysis_stage_results"
+    __table_args__ = (UniqueConstraint("task_id", "stage"),)
+
+    id = Column(Integer, primary_key=True, index=True)  # Increasing, doubles as the SSE event ID
+    task_id = Column(String, ForeignKey("analysis_tasks.task_id"), index=True)
+    stage = Column(String)  # e.g. "desirable", "key_findings", "recommendations"
+    output = Column(JSON)  # Output of the stage
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Relationships
+    task = relationship("AnalysisTask", back_populates="stage_results")
     
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -0,0 +1,144 @@
+import time
+import asyncio
+from typing import Dict, List, Set, Tuple, Type, Any, Optional, Callable, Awaitable, Iterable
+from llm_client import usage_recorder
+import deadlines
+
+# Called with (stage name, stage output) as soon as a stage completes
+StageCallback = Callable[[str, Any], None]
+
+class StageError(Exception):
+    """Raised when one or more pipeline stages fail.
+
+    ``errors`` maps stage name to the exception it raised and ``results`` holds
+    the outputs of the stages that completed, so callers can keep them.
+    """
+    def __init__(self, errors: Dict[str, BaseException], results: Optional[Dict[str, Any]] = None):
+        self.errors = errors
+        self.results = results or {}
+        details = ", ".join(f"{stage}: {error}" for stage, error in errors.items())
+        super().__init__(f"Analysis stage(s) failed - {details}")
+
+class Stage:
+    """A pipeline stage.
+
+    ``run`` is called with a dict of the outputs of the stages named in
+    ``inputs`` once all of them have completed. A stage is retried up to
+    ``retries`` times if it fails or exceeds ``timeout`` seconds (or the
+    enclosing deadline, if sooner), unless the error is one of ``no_retry``.
+    Outputs of stages with ``publish`` set are passed to the pipeline's
+    on_stage callback.
+    """
+    def __init__(self, name: str, run: Callable[[Dict[str, Any]], Awaitable[Any]], inputs: Iterable[str] = (),
+                 timeout: Optional[float] = None, retries: int = 0, publish: bool = True,
+                 no_retry: Tuple[Type[BaseException], ...] = ()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.timeout = timeout
+        self.retries = retries
+        self.publish = publish
+        self.no_retry = no_retry
+
+class PipelineRun:
+    """Outputs of a pipeline run with the running time (seconds) and token usage of each stage.
+
+    Running time excludes waiting for a concurrency slot, so parallel and sequential runs compare.
+    """
+    def __init__(self, outputs: Dict[str, Any], timings: Dict[str, float], tokens: Dict[str, Dict[str, int]]):
+        self.outputs = outputs
+        self.timings = timings
+        self.tokens = tokens
+
+def required_stages(stages: List[Stage], completed: Dict[str, Any]) -> Set[str]:
+    """Names of the stages still to run: final stages without an output and the missing stages they need."""
+    feeding = {name for stage in stages for name in stage.inputs}
+    by_name = {stage.name: stage for stage in stages}
+    required: Set[str] = set()
+    pending = [stage.name for stage in stages if stage.name not in feeding and stage.name not in completed]
+    while pending:
+        name = pending.pop()
+        if name in required:
+            continue
+        required.add(name)
+        pending.extend(dependency for dependency in by_name[name].inputs if dependency not in completed)
+    return required
+
+async def run_pipeline(stages: List[Stage], max_concurrency: int, on_stage: Optional[StageCallback] = None,
+                       completed: Optional[Dict[str, Any]] = None) -> PipelineRun:
+    """Run stages as soon as their inputs are ready, at most ``max_concurrency`` at a time.
+
+    Outputs in ``completed`` are used as-is and their stages are not run again,
+    nor are stages that only feed completed stages. A failing stage does not
+    stop independent stages; stages that depend on it are skipped, and a
+    StageError with every failure is raised at the end.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dependency in stage.inputs:
+            if dependency not in by_name:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dependency}")
+
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+    outputs = dict(completed or {})
+    timings: Dict[str, float] = {}
+    tokens: Dict[str, Dict[str, int]] = {}
+    errors: Dict[str, BaseException] = {}
+    waiting = [stage for stage in stages if stage.name in required_stages(stages, outputs)]
+    running: Dict[asyncio.Task, Stage] = {}
+
+    async def execute(stage: Stage) -> Any:
+        usage = tokens.setdefault(stage.name, {"prompt_tokens": 0, "completion_tokens": 0})
+        usage_recorder.set(usage)  # Local to this stage's task
+        inputs = {name: outputs[name] for name in stage.inputs}
+        running_time = 0.0
+        try:
+            for attempt in range(stage.retries + 1):
+                try:
+                    async with slots:
+                        # Timed once a slot is free, so queueing behind other stages is not counted
+                        start = time.perf_counter()
+                        try:
+                            # The stage's timeout becomes the deadline of the calls it makes
+                            with deadlines.deadline(stage.timeout):
+                                return await asyncio.wait_for(stage.run(inputs), deadlines.remaining())
+                        finally:
+                            running_time += time.perf_counter() - start
+                except Exception as e:
+                    # No point retrying once the enclosing deadline has passed
+                    if attempt == stage.retries or isinstance(e, stage.no_retry) or deadlines.expired():
+                        raise
+                    print(f"Stage {stage.name} failed (attempt {attempt + 1}), retrying: {str(e)}")
+        finally:
+            timings[stage.name] = round(running_time, 3)
+
+    while waiting or running:
+        # Start every stage whose inputs are ready; skip those whose inputs failed
+        for stage in list(waiting):
+            failed = [name for name in stage.inputs if name in errors]
+            if failed:
+                errors[stage.name] = RuntimeError(f"skipped because {', '.join(failed)} failed")
+                waiting.remove(stage)
+            elif all(name in outputs for name in stage.inputs):
+                running[asyncio.create_task(execute(stage))] = stage
+                waiting.remove(stage)
+
+        if not running:
+            # Nothing can make progress (only possible with a dependency cycle)
+            for stage in waiting:
+                errors[stage.name] = RuntimeError("unresolvable stage dependencies")
+            break
+
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            stage = running.pop(task)
+            if task.exception() is not None:
+                errors[stage.name] = task.exception()
+                continue
+            outputs[stage.name] = task.result()
+            if stage.publish and on_stage:
+                on_stage(stage.name, outputs[stage.name])
+
+    if errors:
+        raise StageError(errors, outputs)
+    return PipelineRun(outputs, timings, tokens)
@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import time
+import fcntl
+import asyncio
+from typing import Dict, Any, Callable, Mapping, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+OPENAI_RPM_LIMIT = float(os.getenv("OPENAI_RPM_LIMIT", "500"))  # Requests per minute
+OPENAI_TPM_LIMIT = float(os.getenv("OPENAI_TPM_LIMIT", "300000"))  # Tokens per minute
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "10"))  # Bucket size, in seconds of quota
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local").lower()  # "local" (per process) or "file" (per host)
+RATE_LIMIT_STATE_PATH = os.getenv("RATE_LIMIT_STATE_PATH", "./rate_limit.state")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse an OpenAI reset duration such as "20ms", "1.5s" or "6m0s" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+class LocalStore:
+    """Limiter state held in this process."""
+
+    blocking = False
+
+    def __init__(self):
+        self.state: Dict[str, Any] = {}
+
+    def transact(self, update: Callable[[Dict[str, Any]], Any]) -> Any:
+        return update(self.state)
+
+class FileStore:
+    """Limiter state in a JSON file guarded by an exclusive lock, shared by every process on the host."""
+
+    blocking = True  # Waits for the lock and does file I/O
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def transact(self, update: Callable[[Dict[str, Any]], Any]) -> Any:
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else {}
+                result = update(state)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute.
+
+    Both buckets refill continuously and hold ``burst_seconds`` worth of quota.
+    A request waits until both buckets can cover it. The rates follow the
+    limits reported in upstream rate-limit headers (never exceeding the
+    configured ones), and a 429 pauses every caller sharing the store until
+    the upstream reset time.
+    """
+
+    def __init__(self, rpm: float, tpm: float, store, burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.store = store
+        self.burst_seconds = burst_seconds
+
+    async def _transact(self, update: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Run ``update`` on the shared state; blocking stores run in a thread to keep the event loop free."""
+        if self.store.blocking:
+            return await asyncio.to_thread(self.store.transact, update)
+        return self.store.transact(update)
+
+    def _refill(self, state: Dict[str, Any], now: float):
+        if not state:
+            state.update(
+                rpm=self.rpm,
+                tpm=self.tpm,
+                requests=self.rpm * self.burst_seconds / 60,
+                tokens=self.tpm * self.burst_seconds / 60,
+                updated=now,
+                blocked_until=0.0,
+            )
+        elapsed = max(0.0, now - state["updated"])
+        state["requests"] = min(self._capacity(state["rpm"]), state["requests"] + elapsed * state["rpm"] / 60)
+        state["tokens"] = min(self._capacity(state["tpm"]), state["tokens"] + elapsed * state["tpm"] / 60)
+        state["updated"] = now
+
+    def _capacity(self, per_minute: float) -> float:
+        return max(1.0, per_minute * self.burst_seconds / 60)
+
+    def _take(self, state: Dict[str, Any], tokens: float, now: float) -> float:
+        """Take one request and ``tokens`` from the buckets, or return how long to wait."""
+        self._refill(state, now)
+        tokens = min(tokens, self._capacity(state["tpm"]))  # Oversized requests wait for a full bucket
+        wait = max(
+            state["blocked_until"] - now,
+            (1 - state["requests"]) * 60 / state["rpm"],
+            (tokens - state["tokens"]) * 60 / state["tpm"],
+        )
+        if wait > 0:
+            return wait
+        state["requests"] -= 1
+        state["tokens"] -= tokens
+        return 0.0
+
+    async def acquire(self, tokens: float):
+        """Wait until a request using ``tokens`` tokens fits within the limits."""
+        while True:
+            wait = await self._transact(lambda state: self._take(state, tokens, time.time()))
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def reconcile(self, estimated: float, actual: float):
+        """Correct the token bucket once the actual usage of a request is known."""
+        def update(state):
+            self._refill(state, time.time())
+            state["tokens"] = min(self._capacity(state["tpm"]), state["tokens"] + estimated - actual)
+        await self._transact(update)
+
+    async def update_from_headers(self, headers: Mapping[str, str]):
+        """Adapt to the limits and remaining quota reported by the upstream API."""
+        def update(state):
+            now = time.time()
+            self._refill(state, now)
+            for kind, bucket, limit_key, configured in (
+                ("requests", "requests", "rpm", self.rpm),
+                ("tokens", "tokens", "tpm", self.tpm),
+            ):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                if limit:
+                    state[limit_key] = min(configured, float(limit))
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is not None:
+                    # Other clients may share the quota: never believe we have more than upstream says
+                    state[bucket] = min(state[bucket], float(remaining))
+        await self._transact(update)
+
+    async def block(self, headers: Mapping[str, str]):
+        """Pause every caller after a 429, until upstream says the quota resets."""
+        delay = (
+            parse_reset(headers.get("retry-after"))
+            or max(
+                parse_reset(headers.get("x-ratelimit-reset-requests")) or 0,
+                parse_reset(headers.get("x-ratelimit-reset-tokens")) or 0,
+            )
+            or 1.0
+        )
+        def update(state):
+            now = time.time()
+            self._refill(state, now)
+            state["blocked_until"] = max(state["blocked_until"], now + delay)
+        await self._transact(update)
+
+_limiter: Optional[RateLimiter] = None
+
+def get_limiter() -> RateLimiter:
+    """Get the rate limiter configured from the OPENAI_*_LIMIT and RATE_LIMIT_* settings."""
+    global _limiter
+    if _limiter is None:
+        store = FileStore(RATE_LIMIT_STATE_PATH) if RATE_LIMIT_BACKEND == "file" else LocalStore()
+        _limiter = RateLimiter(OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, store)
+    return _limiter
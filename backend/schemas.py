@@ -116,6 +116,13 @@ class ImplementationPlan(BaseModel):
     timeline: str
     success_metrics: List[str]
 
+class KeyFindings(BaseModel):
+    key_findings: List[str]
+
+class ModelRecommendation(BaseModel):
+    model_type: str  # e.g. "Freemium", "Free Trial", "Usage-Based"
+    explanation: str
+
 class Analysis(BaseModel):
     score: float
     desirable: AnalysisScore
@@ -176,6 +183,7 @@ class QuizResult(QuizResultCreate):
     created_at: datetime
     updated_at: datetime
     version: int
+    is_provisional: Optional[bool] = False
 
     class Config:
         orm_mode = True
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key onto a single execution.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still in flight await the same result (or exception) instead of starting
+    their own. The work runs in its own task, so one caller being cancelled
+    does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0  # Number of calls that joined an in-flight execution
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            async def run():
+                try:
+                    return await fn()
+                finally:
+                    if self._calls.get(key) is task:
+                        del self._calls[key]
+
+            task = asyncio.ensure_future(run())
+            self._calls[key] = task
+            # Mark the exception as retrieved even if every caller was cancelled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Number of distinct keys currently executing."""
+        return len(self._calls)
@@ -6,6 +6,11 @@ cd "$(dirname "$0")"
 python -m uvicorn main:app --reload &
 BACKEND_PID=$!
 
+# Start the analysis worker
+echo "Starting analysis worker..."
+python -m worker &
+WORKER_PID=$!
+
 # Start the frontend
 echo "Starting frontend server..."
 npm start &
@@ -15,6 +20,7 @@ FRONTEND_PID=$!
 function cleanup {
   echo "Shutting down servers..."
   kill $BACKEND_PID
+  kill $WORKER_PID
   kill $FRONTEND_PID
   exit
 }
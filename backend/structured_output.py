@@ -0,0 +1,91 @@
+import re
+import json
+from typing import Any, List
+from pydantic import ValidationError
+
+_CODE_FENCE = re.compile(r"^```[a-zA-Z]*\s*(.*?)\s*(?:```)?$", re.S)
+_DANGLING_KEY = re.compile(r'[,{]\s*"(?:[^"\\]|\\.)*"\s*:?$')
+_CLOSERS = {"{": "}", "[": "]"}
+
+def _strip_dangling(text: str, in_object: bool) -> str:
+    """Drop a trailing comma, or an object key left without a value."""
+    text = text.rstrip()
+    if text.endswith(","):
+        return text[:-1].rstrip()
+    match = _DANGLING_KEY.search(text) if in_object else None
+    if match:
+        # Keep the "{" of an object whose only key was cut off
+        return text[:match.start()] + ("{" if match.group(0).startswith("{") else "")
+    return text
+
+def repair_json(text: str) -> str:
+    """Fix the usual defects of model-written JSON.
+
+    Removes markdown code fences and any prose around the JSON value, drops
+    trailing commas, and closes strings, arrays and objects left open by a
+    truncated response (dropping a member that was cut off mid-way).
+    """
+    text = text.strip()
+    fence = _CODE_FENCE.match(text)
+    if fence:
+        text = fence.group(1)
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return text
+    text = text[min(starts):]
+
+    out = ""
+    stack: List[str] = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            out += char
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            out = _strip_dangling(out, in_object=False)
+            if stack:
+                stack.pop()
+            out += char
+            if not stack:
+                break  # Ignore anything after the JSON value
+            continue
+        out += char
+
+    if in_string:
+        out = (out[:-1] if escape else out) + '"'
+    if stack:
+        # Truncated response: close everything still open
+        out = _strip_dangling(out, in_object=stack[-1] == "}")
+        out += "".join(reversed(stack))
+    return out
+
+def parse_json(text: str) -> Any:
+    """Parse model output as JSON, repairing it first if needed. Raises ValueError if it cannot be parsed."""
+    if text is None:
+        raise ValueError("Empty response")
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair_json(text))
+    except ValueError as e:
+        raise ValueError(f"Response is not valid JSON, even after repair: {str(e)}")
+
+def invalid_fields(error: ValidationError) -> List[str]:
+    """Top-level fields that are missing or invalid, from a pydantic validation error."""
+    fields = []
+    for detail in error.errors():
+        if detail["loc"] and str(detail["loc"][0]) not in fields:
+            fields.append(str(detail["loc"][0]))
+    return fields
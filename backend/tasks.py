@@ -0,0 +1,181 @@
+import copy
+from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional
+import crud
+import schemas
+import ai_analysis
+import analysis
+import circuit_breaker
+import llm_metrics
+from pipeline import StageError
+
+# Job queue used for analysis tasks
+ANALYSIS_QUEUE = "analysis"
+
+def build_analysis_job(task_id: str, submission: schemas.QuizSubmission, user_id: str,
+                       base_result_id: Optional[int] = None) -> Dict[str, Any]:
+    """Build the queue payload for an analysis task"""
+    return {
+        "task_id": task_id,
+        "user_id": user_id,
+        "submission": submission.dict(),
+        "base_result_id": base_result_id
+    }
+
+async def run_analysis_job(payload: Dict[str, Any], db: Session):
+    """Run an analysis job taken from the queue, recording the LLM usage of the task"""
+    task_id = payload["task_id"]
+    # Usage adds up over the attempts of a retried job
+    task = crud.get_analysis_task(db, task_id)
+    usage = copy.deepcopy(task.llm_usage or {}) if task else {}
+    try:
+        with llm_metrics.task_usage(task_id, usage):
+            await process_analysis_task(
+                task_id=task_id,
+                submission=schemas.QuizSubmission(**payload["submission"]),
+                user_id=payload["user_id"],
+                db=db,
+                base_result_id=payload.get("base_result_id")
+            )
+    finally:
+        crud.update_analysis_task(db, task_id, llm_usage=usage)
+
+def build_quiz_result(submission: schemas.QuizSubmission, result: Dict[str, Any]) -> schemas.QuizResultCreate:
+    """Build the quiz result to store for a submission and its analysis"""
+    return schemas.QuizResultCreate(
+        # Context information
+        product_description=submission.context.product_description,
+        target_audience=submission.context.target_audience,
+        business_goals=submission.context.business_goals,
+        
+        # User journey information
+        user_endgame=submission.user_journey.user_endgame,
+        beginner_stage=submission.user_journey.beginner_stage,
+        intermediate_stage=submission.user_journey.intermediate_stage,
+        advanced_stage=submission.user_journey.advanced_stage,
+        key_challenges=submission.user_journey.key_challenges,
+        
+        # Current model assessment
+        current_model=submission.current_model.current_model if submission.current_model else None,
+        current_metrics=submission.current_model.current_metrics if submission.current_model else None,
+        
+        # DEEP framework inputs
+        quiz_answers=[a.dict() for a in submission.structured_answers] if submission.structured_answers else [],
+        desirable_inputs=submission.deep_inputs.desirable.dict(),
+        effective_inputs=submission.deep_inputs.effective.dict(),
+        efficient_inputs=submission.deep_inputs.efficient.dict(),
+        polished_inputs=submission.deep_inputs.polished.dict(),
+        
+        # Analysis results
+        analysis_result=result,
+        recommendations=result.get("recommendations", ""),
+        implementation_plan=result.get("implementation_plan", {}),
+        
+        # Scores
+        overall_score=result["score"],
+        desirable_score=result["desirable"]["score"],
+        effective_score=result["effective"]["score"],
+        efficient_score=result["efficient"]["score"],
+        polished_score=result["polished"]["score"],
+        
+        # Recommendations
+        recommended_model=result["recommended_model"]
+    )
+
+def save_preview(db: Session, submission: schemas.QuizSubmission, user_id: str, base_result=None):
+    """Score a submission with the rule-based analyzer and store it as a provisional result"""
+    preview = analysis.analyze_submission(submission.dict())
+    return crud.create_quiz_result(
+        db=db,
+        quiz_result=build_quiz_result(submission, preview),
+        user_id=user_id,
+        project_id=base_result.project_id if base_result else None,
+        version=(base_result.version or 1) + 1 if base_result else 1,
+        is_provisional=True
+    )
+
+def degraded_result(submission: schemas.QuizSubmission) -> Dict[str, Any]:
+    """Rule-based analysis used in place of the AI analysis while the LLM is unavailable"""
+    result = analysis.analyze_submission(submission.dict())
+    result["degraded"] = True
+    return result
+
+def reusable_outputs(submission: schemas.QuizSubmission, base_result) -> Dict[str, Any]:
+    """Stage outputs of a previous result that the analysis of an edited submission can reuse"""
+    # Provisional and degraded results hold rule-based scores, not stage outputs
+    if not base_result or base_result.is_provisional or not base_result.analysis_result:
+        return {}
+    if base_result.analysis_result.get("degraded"):
+        return {}
+    base_submission = {
+        "context": {
+            "product_description": base_result.product_description,
+            "target_audience": base_result.target_audience,
+            "business_goals": base_result.business_goals,
+        },
+        "deep_inputs": {
+            "desirable": base_result.desirable_inputs,
+            "effective": base_result.effective_inputs,
+            "efficient": base_result.efficient_inputs,
+            "polished": base_result.polished_inputs,
+        },
+    }
+    return ai_analysis.reusable_outputs(submission.dict(), base_submission, base_result.analysis_result)
+
+async def process_analysis_task(task_id: str, submission: schemas.QuizSubmission, user_id: str, db: Session,
+                                base_result_id: Optional[int] = None):
+    """Run the analysis for a task and save the result.
+
+    With ``base_result_id`` the analysis is incremental: stages whose inputs did
+    not change since that result are reused, and the result is saved as its next version.
+    Stages checkpointed by an earlier attempt of the same task are not run again.
+    """
+    try:
+        crud.update_analysis_task(db, task_id, status="processing", stage="analysis")
+        
+        base_result = crud.get_quiz_result(db, quiz_result_id=base_result_id) if base_result_id else None
+        completed = reusable_outputs(submission, base_result)
+        
+        # Stage outputs are checkpointed as they complete, so a retried task
+        # resumes from the stages that are still missing
+        checkpoints = crud.get_stage_results(db, task_id)
+        if checkpoints:
+            print(f"Resuming analysis {task_id} from {len(checkpoints)} checkpointed stage(s)")
+        completed.update({checkpoint.stage: checkpoint.output for checkpoint in checkpoints})
+        
+        # Perform the analysis, publishing each stage's output as it completes
+        try:
+            result = await ai_analysis.analyze_quiz_submission(
+                submission.dict(),
+                on_stage=lambda stage, output: crud.save_stage_result(db, task_id, stage, output),
+                completed=completed,
+                base_result_id=base_result_id,
+                checkpointed=[checkpoint.stage for checkpoint in checkpoints]
+            )
+        except StageError as e:
+            circuit_open = any(isinstance(error, circuit_breaker.CircuitOpenError) for error in e.errors.values())
+            if not circuit_open or circuit_breaker.CIRCUIT_OPEN_POLICY != "degrade":
+                raise
+            # The LLM is unavailable: finish with rule-based scoring instead of holding the worker
+            print(f"LLM circuit open, completing analysis {task_id} with degraded scoring")
+            result = degraded_result(submission)
+        
+        # Create the quiz result
+        quiz_result = build_quiz_result(submission, result)
+        
+        # Save the result with the task ID, replacing its provisional result
+        crud.update_analysis_task(db, task_id, stage="saving")
+        crud.create_quiz_result_with_task_id(
+            db=db,
+            quiz_result=quiz_result,
+            user_id=user_id,
+            task_id=task_id,
+            project_id=base_result.project_id if base_result else None,
+            version=(base_result.version or 1) + 1 if base_result else 1
+        )
+        
+    except Exception as e:
+        # Leave the task status to the caller, which knows whether it will be retried
+        print(f"Error processing analysis: {str(e)}")
+        db.rollback()
+        raise
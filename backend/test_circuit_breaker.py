@@ -0,0 +1,74 @@
+import pytest
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+def breaker(open_seconds: float = 0, **settings) -> CircuitBreaker:
+    return CircuitBreaker(**{"window": 60, "min_calls": 4, "error_rate": 0.5, "slow_call_seconds": 10,
+                             "slow_rate": 0.5, "open_seconds": open_seconds, **settings})
+
+def call(circuit: CircuitBreaker, failed: bool = False, duration: float = 0.1):
+    probe = circuit.before_call()
+    circuit.record(duration, failed, probe)
+
+def trip(circuit: CircuitBreaker):
+    for _ in range(circuit.min_calls):
+        call(circuit, failed=True)
+    assert circuit.state == OPEN
+
+def test_stays_closed_below_min_calls_and_error_rate():
+    circuit = breaker()
+    for _ in range(3):
+        call(circuit, failed=True)
+    assert circuit.state == CLOSED
+    for _ in range(4):
+        call(circuit)
+    assert circuit.state == CLOSED
+
+def test_opens_on_errors_and_rejects_calls():
+    circuit = breaker(open_seconds=60)
+    trip(circuit)
+    with pytest.raises(CircuitOpenError) as error:
+        circuit.before_call()
+    assert 0 < error.value.retry_after <= 60
+    assert circuit.rejected == 1
+
+def test_opens_on_slow_calls():
+    circuit = breaker()
+    for _ in range(4):
+        call(circuit, duration=11)
+    assert circuit.state == OPEN
+
+def test_lets_a_single_probe_through_after_the_cool_down():
+    circuit = breaker()
+    trip(circuit)
+    assert circuit.before_call() is True
+    assert circuit.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+
+def test_probe_success_closes_and_failure_reopens():
+    circuit = breaker()
+    trip(circuit)
+    call(circuit)
+    assert circuit.state == CLOSED
+
+    trip(circuit)
+    call(circuit, failed=True)
+    assert circuit.state == OPEN
+
+def test_only_the_probe_decides_a_half_open_breaker():
+    circuit = breaker()
+    in_flight = circuit.before_call()  # Started before the breaker opened
+    trip(circuit)
+    probe = circuit.before_call()
+
+    circuit.record(0.1, False, in_flight)
+    assert circuit.state == HALF_OPEN
+    circuit.record(0.1, True, probe)
+    assert circuit.state == OPEN
+
+def test_released_probe_frees_the_slot():
+    circuit = breaker()
+    trip(circuit)
+    probe = circuit.before_call()
+    circuit.release(probe)
+    assert circuit.before_call() is True
@@ -0,0 +1,60 @@
+import time
+import pytest
+from job_queue import JobQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), visibility_timeout=60, max_attempts=2, retry_delay=0)
+
+def test_jobs_are_claimed_once_and_acknowledged(queue):
+    job_id = queue.enqueue("analysis", {"task_id": "t1"})
+    job = queue.claim("analysis")
+    assert job.id == job_id
+    assert job.payload == {"task_id": "t1"}
+    assert job.attempts == 1
+    assert queue.claim("analysis") is None  # Hidden while leased
+    assert queue.counts("analysis") == {"queued": 0, "running": 1}
+
+    assert queue.ack(job)
+    assert queue.counts("analysis") == {"queued": 0, "running": 0}
+    assert queue.recent_duration("analysis") is not None
+
+def test_queues_are_separate(queue):
+    queue.enqueue("other", {})
+    assert queue.claim("analysis") is None
+
+def test_delayed_jobs_are_not_claimable_yet(queue):
+    queue.enqueue("analysis", {}, delay=60)
+    assert queue.claim("analysis") is None
+    assert queue.counts("analysis")["queued"] == 1
+
+def test_an_expired_lease_is_claimed_again_and_the_old_lease_is_void(queue):
+    queue.enqueue("analysis", {})
+    first = queue.claim("analysis")
+    assert queue.extend(first, seconds=0.01)
+    time.sleep(0.02)
+
+    second = queue.claim("analysis")
+    assert second.id == first.id
+    assert second.attempts == 2
+    # The first worker lost its lease: it can neither extend nor acknowledge the job
+    assert not queue.extend(first)
+    assert not queue.ack(first)
+    assert queue.ack(second)
+
+def test_failed_jobs_are_retried_until_they_die(queue):
+    queue.enqueue("analysis", {})
+    job = queue.claim("analysis")
+    assert queue.nack(job, "first failure")
+
+    retried = queue.claim("analysis")
+    assert retried.attempts == 2
+    assert not queue.nack(retried, "second failure")  # max_attempts reached
+    assert queue.claim("analysis") is None
+    assert queue.counts("analysis") == {"queued": 0, "running": 0}
+
+def test_retries_back_off(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), max_attempts=3, retry_delay=60)
+    queue.enqueue("analysis", {})
+    assert queue.nack(queue.claim("analysis"), "failure")
+    assert queue.claim("analysis") is None
@@ -0,0 +1,37 @@
+import asyncio
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+from openai import APIConnectionError
+import llm_client
+import llm_metrics
+
+@pytest.fixture
+def failing_upstream(monkeypatch, word_tokens):
+    """Every request fails with a retryable connection error, and retries do not wait."""
+    async def fail(*args, **kwargs):
+        raise APIConnectionError(request=httpx.Request("POST", "http://llm.test/v1/chat/completions"))
+
+    monkeypatch.setattr(llm_client, "create_completion", fail)
+    monkeypatch.setattr(llm_client, "LLM_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(llm_client, "wait_random_exponential", lambda **kwargs: lambda retry_state: 0)
+
+def test_retries_of_failed_calls_are_recorded(failing_upstream):
+    async def run():
+        with llm_metrics.track("test", "gpt-4o"):
+            await llm_client.chat_completion([{"role": "user", "content": "hi"}], "gpt-4o", 10, 0.0, stage="test")
+
+    with pytest.raises(APIConnectionError):
+        asyncio.run(run())
+    assert REGISTRY.get_sample_value("llm_retries_total", {"stage": "test", "model": "gpt-4o"}) == 2
+
+def test_retries_of_failed_streams_are_recorded(failing_upstream):
+    call = llm_metrics.LLMCall("chat", "gpt-4o")
+
+    async def run():
+        async for _ in llm_client.stream_chat_completion([], "gpt-4o", 10, 0.0, call=call):
+            pass
+
+    with pytest.raises(APIConnectionError):
+        asyncio.run(run())
+    assert call.retries == 2
@@ -0,0 +1,105 @@
+import asyncio
+import pytest
+from pipeline import Stage, StageError, required_stages, run_pipeline
+
+def constant(value, delay=0.0):
+    async def run(inputs):
+        await asyncio.sleep(delay)
+        return value
+    return run
+
+def test_stages_receive_the_outputs_of_their_inputs():
+    async def total(inputs):
+        return inputs["a"] + inputs["b"]
+
+    stages = [Stage("a", constant(1)), Stage("b", constant(2)), Stage("total", total, inputs=["a", "b"])]
+    run = asyncio.run(run_pipeline(stages, max_concurrency=4))
+    assert run.outputs == {"a": 1, "b": 2, "total": 3}
+
+def test_concurrency_is_limited():
+    active = 0
+    peak = 0
+
+    async def tracked(inputs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+
+    asyncio.run(run_pipeline([Stage(str(i), tracked) for i in range(6)], max_concurrency=2))
+    assert peak == 2
+
+def test_timings_exclude_waiting_for_a_slot():
+    stages = [Stage(str(i), constant(None, delay=0.05)) for i in range(3)]
+    run = asyncio.run(run_pipeline(stages, max_concurrency=1))
+    # Run one after another, but each stage only counts its own 50ms
+    assert all(timing < 0.09 for timing in run.timings.values())
+
+def test_a_failure_skips_dependents_but_not_independent_stages():
+    async def fail(inputs):
+        raise RuntimeError("boom")
+
+    stages = [
+        Stage("bad", fail),
+        Stage("dependent", constant(1), inputs=["bad"]),
+        Stage("independent", constant(2)),
+    ]
+    with pytest.raises(StageError) as error:
+        asyncio.run(run_pipeline(stages, max_concurrency=4))
+    assert set(error.value.errors) == {"bad", "dependent"}
+    assert error.value.results == {"independent": 2}
+
+def test_failed_stages_are_retried():
+    attempts = 0
+
+    async def flaky(inputs):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise RuntimeError("transient")
+        return "ok"
+
+    run = asyncio.run(run_pipeline([Stage("flaky", flaky, retries=1)], max_concurrency=1))
+    assert run.outputs["flaky"] == "ok"
+    assert attempts == 2
+
+def test_no_retry_errors_are_not_retried():
+    attempts = 0
+
+    async def fatal(inputs):
+        nonlocal attempts
+        attempts += 1
+        raise KeyError("fatal")
+
+    with pytest.raises(StageError):
+        asyncio.run(run_pipeline([Stage("fatal", fatal, retries=3, no_retry=(KeyError,))], max_concurrency=1))
+    assert attempts == 1
+
+def test_slow_stages_time_out():
+    with pytest.raises(StageError) as error:
+        asyncio.run(run_pipeline([Stage("slow", constant(None, delay=1), timeout=0.01)], max_concurrency=1))
+    assert isinstance(error.value.errors["slow"], asyncio.TimeoutError)
+
+def test_completed_stages_and_their_feeders_are_not_run():
+    async def unexpected(inputs):
+        raise AssertionError("should not run")
+
+    stages = [
+        Stage("a", unexpected),
+        Stage("b", unexpected, inputs=["a"]),
+        Stage("c", constant(3), inputs=["b"]),
+    ]
+    assert required_stages(stages, {"b": 2}) == {"c"}
+    run = asyncio.run(run_pipeline(stages, max_concurrency=1, completed={"b": 2}))
+    assert run.outputs == {"b": 2, "c": 3}
+
+def test_only_published_stages_reach_on_stage():
+    published = []
+    stages = [Stage("internal", constant(1), publish=False), Stage("public", constant(2), inputs=["internal"])]
+    asyncio.run(run_pipeline(stages, max_concurrency=1, on_stage=lambda stage, output: published.append(stage)))
+    assert published == ["public"]
+
+def test_unknown_dependencies_are_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(run_pipeline([Stage("a", constant(1), inputs=["missing"])], max_concurrency=1))
@@ -0,0 +1,39 @@
+import pytest
+from pydantic import BaseModel, ValidationError
+from structured_output import invalid_fields, parse_json, repair_json
+
+def test_valid_json_is_parsed_as_is():
+    assert parse_json('{"score": 3, "items": ["a"]}') == {"score": 3, "items": ["a"]}
+
+def test_code_fences_and_prose_are_removed():
+    assert parse_json('```json\n{"a": 1}\n```') == {"a": 1}
+    assert parse_json('Here is the analysis: {"a": 1} Hope this helps!') == {"a": 1}
+
+def test_trailing_commas_are_dropped():
+    assert parse_json('{"a": [1, 2,], "b": 3,}') == {"a": [1, 2], "b": 3}
+
+def test_truncated_responses_are_closed():
+    assert parse_json('{"a": [1, 2') == {"a": [1, 2]}
+    assert parse_json('{"a": "unfinished') == {"a": "unfinished"}
+    assert parse_json('{"a": 1, "b": {"c": 2}, "d"') == {"a": 1, "b": {"c": 2}}
+    assert parse_json('{"a": {"b"') == {"a": {}}
+
+def test_strings_with_brackets_and_escapes_survive_repair():
+    text = '{"a": "x } ] \\" y", "b": [1,'
+    assert parse_json(text) == {"a": 'x } ] " y', "b": [1]}
+    assert repair_json('{"a": 1}') == '{"a": 1}'
+
+def test_unparseable_text_raises_value_error():
+    with pytest.raises(ValueError):
+        parse_json("no json here")
+    with pytest.raises(ValueError):
+        parse_json(None)
+
+def test_invalid_fields_lists_top_level_fields_once():
+    class Finding(BaseModel):
+        title: str
+        scores: list
+
+    with pytest.raises(ValidationError) as error:
+        Finding.parse_obj({"scores": "not a list"})
+    assert invalid_fields(error.value) == ["title", "scores"]
@@ -0,0 +1,39 @@
+import token_budget
+from token_budget import TRUNCATION_MARKER, completion_budget, count_tokens, fit_fields, truncate_text
+
+def words(count: int, prefix: str = "w") -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+def test_fields_within_budget_are_unchanged(word_tokens):
+    fields = {"a": words(5), "b": words(5), "n": 42}
+    assert fit_fields(fields, budget=10) is fields
+
+def test_short_fields_stay_whole_and_long_ones_share_the_rest(word_tokens):
+    fields = {"short": words(5), "long": words(100), "longer": words(200), "n": 42}
+    fitted = fit_fields(fields, budget=45)
+
+    assert fitted["short"] == fields["short"]
+    assert fitted["n"] == 42
+    assert count_tokens(fitted["long"]) == count_tokens(fitted["longer"]) == 20
+    assert sum(count_tokens(value) for value in fitted.values() if isinstance(value, str)) <= 45
+
+def test_fit_fields_is_deterministic(word_tokens):
+    fields = {"b": words(50, "b"), "a": words(50, "a")}
+    assert fit_fields(fields, budget=30) == fit_fields(dict(reversed(list(fields.items()))), budget=30)
+
+def test_truncation_keeps_the_beginning_and_the_end(word_tokens):
+    truncated = truncate_text(words(100), 10)
+    assert count_tokens(truncated) == 10
+    assert truncated.startswith("w0 w1")
+    assert truncated.endswith("w98 w99")
+    assert TRUNCATION_MARKER.strip() in truncated
+
+def test_completion_budget_is_limited_by_the_context_window():
+    assert completion_budget("chat", 0) == token_budget.COMPLETION_BUDGETS["chat"]
+    prompt_tokens = token_budget.MODEL_CONTEXT_WINDOW - token_budget.CONTEXT_SAFETY_MARGIN - 100
+    assert completion_budget("chat", prompt_tokens) == 100
+    assert completion_budget("chat", token_budget.MODEL_CONTEXT_WINDOW) == 1
+
+def test_synthesis_budget_covers_every_section():
+    sections = sum(token_budget.COMPLETION_BUDGETS[section] for section in token_budget.SYNTHESIS_SECTIONS)
+    assert token_budget.COMPLETION_BUDGETS["synthesis"] >= sections
@@ -0,0 +1,102 @@
+import os
+import json
+from functools import lru_cache
+from typing import Dict, List, Any
+from dotenv import load_dotenv
+import tiktoken
+
+# Load environment variables
+load_dotenv()
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")
+MODEL_CONTEXT_WINDOW = int(os.getenv("MODEL_CONTEXT_WINDOW", "128000"))
+CONTEXT_SAFETY_MARGIN = 256  # Tokens kept free to absorb counting differences
+
+# Max tokens of user-provided text allowed into each kind of prompt
+FIELD_BUDGETS = {
+    "dimension": 3000,  # All inputs of one DEEP dimension
+    "context": 1500,  # Product description, target audience and business goals
+    "chat": 3000,  # The user's chat message
+}
+
+# Max completion tokens per stage
+COMPLETION_BUDGETS = {
+    "dimension": 1200,
+    "key_findings": 800,
+    "model_recommendation": 600,
+    "implementation_plan": 2500,
+    "recommendations": 2000,
+    "chat": 1000,
+}
+SYNTHESIS_SECTIONS = ("key_findings", "model_recommendation", "implementation_plan", "recommendations")
+
+# Budgets can be overridden with a JSON object, e.g. {"completion": {"chat": 600}, "fields": {"context": 1000}}
+_overrides = json.loads(os.getenv("TOKEN_BUDGETS", "{}"))
+FIELD_BUDGETS.update(_overrides.get("fields", {}))
+COMPLETION_BUDGETS.update(_overrides.get("completion", {}))
+# The combined synthesis call writes every section in one reply, so it gets their budgets combined
+COMPLETION_BUDGETS.setdefault("synthesis", sum(COMPLETION_BUDGETS[section] for section in SYNTHESIS_SECTIONS))
+
+TRUNCATION_MARKER = " [...] "
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = MODEL):
+    """Load the tokenizer for a model once and reuse it."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: str = MODEL) -> int:
+    """Count the number of tokens in a text string."""
+    return len(get_encoder(model).encode(text))
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = MODEL) -> int:
+    """Estimate the prompt tokens of a list of chat messages, including per-message overhead."""
+    return sum(count_tokens(message["content"], model) + 4 for message in messages) + 3
+
+def truncate_text(text: str, max_tokens: int, model: str = MODEL) -> str:
+    """Shorten text to at most ``max_tokens``, keeping its beginning and end."""
+    encoder = get_encoder(model)
+    tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    keep = max_tokens - len(encoder.encode(TRUNCATION_MARKER))
+    if keep <= 0:
+        return encoder.decode(tokens[:max_tokens])
+    head = keep * 2 // 3
+    tail = keep - head
+    return encoder.decode(tokens[:head]) + TRUNCATION_MARKER + encoder.decode(tokens[len(tokens) - tail:])
+
+def fit_fields(fields: Dict[str, Any], budget: int, model: str = MODEL) -> Dict[str, Any]:
+    """Deterministically shrink text fields until together they fit in ``budget`` tokens.
+
+    Short fields are kept whole; the longest fields are truncated to a common cap,
+    so one oversized field cannot crowd out the others. Non-text values are left as is.
+    """
+    counts = {
+        name: count_tokens(value, model)
+        for name, value in fields.items() if isinstance(value, str)
+    }
+    if sum(counts.values()) <= budget:
+        return fields
+
+    # Find the largest cap such that fields under it stay whole and the rest share what is left
+    remaining = budget
+    cap = 0
+    ordered = sorted(counts.items(), key=lambda item: (item[1], item[0]))
+    for index, (name, count) in enumerate(ordered):
+        share = remaining // (len(ordered) - index)
+        if count > share:
+            cap = share
+            break
+        remaining -= count
+
+    return {
+        name: truncate_text(value, cap, model) if counts.get(name, 0) > cap else value
+        for name, value in fields.items()
+    }
+
+def completion_budget(stage: str, prompt_tokens: int) -> int:
+    """Max completion tokens for a stage, limited by what is left of the context window."""
+    available = MODEL_CONTEXT_WINDOW - prompt_tokens - CONTEXT_SAFETY_MARGIN
+    return max(1, min(COMPLETION_BUDGETS.get(stage, COMPLETION_BUDGETS["synthesis"]), available))
@@ -0,0 +1,159 @@
+"""Analysis worker.
+
+Pulls analysis jobs from the durable job queue and runs them outside the API
+process. Each process runs up to --concurrency pipelines at once and
+--processes worker processes can be started side by side (or on several
+hosts sharing the queue file), so analysis throughput scales independently
+of the API.
+
+Usage (from the backend directory, so DATABASE_URL/JOB_QUEUE_PATH resolve
+the same way they do for the API):
+
+    python -m worker --processes 2 --concurrency 8
+"""
+import os
+import sys
+import signal
+import asyncio
+import argparse
+import multiprocessing
+from dotenv import load_dotenv
+
+# Make the backend modules importable when started as `python -m backend.worker`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import crud
+import job_queue
+import llm_client
+import metrics
+import tasks
+from database import SessionLocal
+
+# Load environment variables
+load_dotenv()
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))  # Pipelines per process
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1"))  # Seconds to wait when the queue is empty
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))  # Port serving Prometheus metrics, 0 to disable
+
+async def keep_lease(queue: job_queue.JobQueue, job: job_queue.Job, work: asyncio.Task):
+    """Extend the job's visibility timeout while ``work`` processes it, and cancel ``work`` if the lease is lost."""
+    while True:
+        await asyncio.sleep(queue.visibility_timeout / 3)
+        if not await asyncio.to_thread(queue.extend, job):
+            # The job expired and may already run elsewhere: stop paying for a duplicate run
+            print(f"Lost the lease of job {job.id}, cancelling it")
+            work.cancel()
+            return
+
+async def handle_job(queue: job_queue.JobQueue, job: job_queue.Job):
+    """Run one job and acknowledge or release it."""
+    if job.attempts > queue.max_attempts:
+        # The lease expired on the final attempt, e.g. because its worker crashed
+        db = SessionLocal()
+        try:
+            await asyncio.to_thread(queue.dead, job, "Exceeded maximum attempts")
+            crud.update_analysis_task(db, job.id, status="failed", stage=None, error="Analysis did not complete after repeated attempts")
+            crud.discard_provisional_result(db, job.id)
+        finally:
+            db.close()
+        return
+
+    db = SessionLocal()
+    work = asyncio.create_task(tasks.run_analysis_job(job.payload, db))
+    heartbeat = asyncio.create_task(keep_lease(queue, job, work))
+    try:
+        await work
+        await asyncio.to_thread(queue.ack, job)
+    except asyncio.CancelledError:
+        if not heartbeat.done():
+            raise
+        # Cancelled for losing the lease: the job and its task belong to whoever claims it next
+    except Exception as e:
+        will_retry = await asyncio.to_thread(queue.nack, job, str(e))
+        if will_retry:
+            crud.update_analysis_task(db, job.id, status="pending", stage="retrying", error=str(e))
+        else:
+            crud.update_analysis_task(db, job.id, status="failed", stage=None, error=str(e))
+            crud.discard_provisional_result(db, job.id)
+    finally:
+        heartbeat.cancel()
+        db.close()
+
+async def run_worker(concurrency: int = WORKER_CONCURRENCY):
+    """Claim and run jobs until SIGINT/SIGTERM, then drain the jobs in flight."""
+    queue = job_queue.get_queue()
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    stopping = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    print(f"Worker {os.getpid()} started with concurrency {concurrency}")
+    while not stopping.is_set():
+        await slots.acquire()
+        job = await asyncio.to_thread(queue.claim, tasks.ANALYSIS_QUEUE)
+        if job is None:
+            slots.release()
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        task = asyncio.create_task(handle_job(queue, job))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+    print(f"Worker {os.getpid()} stopping, waiting for {len(in_flight)} job(s)")
+    await asyncio.gather(*in_flight, return_exceptions=True)
+    await llm_client.close_client()
+
+def run_process(concurrency: int):
+    """Entry point for a single worker process."""
+    asyncio.run(run_worker(concurrency))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run analysis workers")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="Number of worker processes")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Concurrent pipelines per process")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        if args.processes > 1 and not metrics.PROMETHEUS_MULTIPROC_DIR:
+            print("Set PROMETHEUS_MULTIPROC_DIR to serve the metrics of all worker processes")
+        from prometheus_client import start_http_server
+        start_http_server(args.metrics_port, registry=metrics.get_registry())
+
+    if args.processes <= 1:
+        run_process(args.concurrency)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_process, args=(args.concurrency,))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    # Forward termination to the children so they can drain their jobs
+    def terminate(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Children receive Ctrl+C themselves
+
+    for process in processes:
+        process.join()
+        if metrics.PROMETHEUS_MULTIPROC_DIR:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(process.pid)
+
+if __name__ == "__main__":
+    main()